@@ -2,59 +2,77 @@
 
 import firebase_admin
 from firebase_admin import credentials, firestore
+from concurrent.futures import ThreadPoolExecutor
 import json
+import sys
 
-# Initialize Firebase
-cred = credentials.Certificate('serviceAccountKey.json')
-firebase_admin.initialize_app(cred)
-
-# Get Firestore client
-db = firestore.client()
-
-print("=== Debugging Firebase Database ===")
-
-# List all collections
-print("\n1. Available collections:")
-collections = db.collections()
-for collection in collections:
-    print(f"  - {collection.id}")
-
-# Check classes collection
-print("\n2. Classes in database:")
-classes_ref = db.collection('classes')
-classes = classes_ref.stream()
-
-class_count = 0
-for class_doc in classes:
-    class_count += 1
-    class_data = class_doc.to_dict()
-    print(f"\n  Class ID: {class_doc.id}")
-    print(f"  Class Name: {class_data.get('name', 'N/A')}")
-    print(f"  Subject: {class_data.get('subject', 'N/A')}")
-    
-    # Check students in array format
-    students_array = class_data.get('students', [])
-    print(f"  Students in array: {len(students_array)}")
-    
-    if students_array:
-        print("  Student details:")
-        for i, student in enumerate(students_array[:3]):  # Show first 3 students
-            print(f"    {i+1}. {student.get('name', 'N/A')} (ID: {student.get('id', 'N/A')})")
-            photo = student.get('photo', '')
-            if photo:
-                if photo.startswith('data:'):
-                    print(f"       Photo: base64 data ({len(photo)} chars)")
+
+def main():
+    # Initialize Firebase
+    cred = credentials.Certificate('serviceAccountKey.json')
+    firebase_admin.initialize_app(cred)
+
+    # Get Firestore client
+    db = firestore.client()
+
+    # Accumulate output and write it once — per-line print() flushes are
+    # slow when stdout is line-buffered (e.g. Docker logs) and classes
+    # have hundreds of students.
+    out = ["=== Debugging Firebase Database ===\n"]
+
+    # List all collections
+    out.append("\n1. Available collections:\n")
+    collections = db.collections()
+    for collection in collections:
+        out.append(f"  - {collection.id}\n")
+
+    # Check classes collection
+    out.append("\n2. Classes in database:\n")
+    classes_ref = db.collection('classes')
+
+    # Fetch all class docs in one round-trip, then fan out the per-class
+    # subcollection reads in parallel instead of paying one RTT per class.
+    class_docs = classes_ref.get()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        subcollections = list(executor.map(
+            lambda doc: list(db.collection('classes').document(doc.id).collection('students').stream()),
+            class_docs
+        ))
+
+    class_count = 0
+    for class_doc, students_subcol in zip(class_docs, subcollections):
+        class_count += 1
+        class_data = class_doc.to_dict()
+        out.append(f"\n  Class ID: {class_doc.id}\n")
+        out.append(f"  Class Name: {class_data.get('name', 'N/A')}\n")
+        out.append(f"  Subject: {class_data.get('subject', 'N/A')}\n")
+
+        # Check students in array format
+        students_array = class_data.get('students', [])
+        out.append(f"  Students in array: {len(students_array)}\n")
+
+        if students_array:
+            out.append("  Student details:\n")
+            for i, student in enumerate(students_array[:3]):  # Show first 3 students
+                out.append(f"    {i+1}. {student.get('name', 'N/A')} (ID: {student.get('id', 'N/A')})\n")
+                photo = student.get('photo', '')
+                if photo:
+                    if photo.startswith('data:'):
+                        out.append(f"       Photo: base64 data ({len(photo)} chars)\n")
+                    else:
+                        out.append(f"       Photo: {photo}\n")
                 else:
-                    print(f"       Photo: {photo}")
-            else:
-                print("       Photo: None")
-        
-        if len(students_array) > 3:
-            print(f"    ... and {len(students_array) - 3} more students")
-    
-    # Check students subcollection (legacy)
-    students_subcol_ref = db.collection('classes').document(class_doc.id).collection('students')
-    students_subcol = list(students_subcol_ref.stream())
-    print(f"  Students in subcollection: {len(students_subcol)}")
-
-print(f"\nTotal classes found: {class_count}")
\ No newline at end of file
+                    out.append("       Photo: None\n")
+
+            if len(students_array) > 3:
+                out.append(f"    ... and {len(students_array) - 3} more students\n")
+
+        # Check students subcollection (legacy, fetched in parallel above)
+        out.append(f"  Students in subcollection: {len(students_subcol)}\n")
+
+    out.append(f"\nTotal classes found: {class_count}\n")
+    sys.stdout.write(''.join(out))
+
+
+if __name__ == "__main__":
+    main()
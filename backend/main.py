@@ -1,7 +1,23 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Query, Request, Response, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+
+# orjson serializes the large report payloads (O(students x sessions)
+# entries) several times faster than the stdlib encoder; fall back to the
+# default JSONResponse when it isn't installed.
+try:
+    import orjson  # noqa: F401 — presence check; ORJSONResponse needs it
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    from fastapi.responses import JSONResponse as DefaultJSONResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
+from PIL import Image
+import hashlib
+import io
+import time
+import asyncio
 import uvicorn
 import os
 import json
@@ -17,6 +33,14 @@ from dotenv import load_dotenv
 import cloudinary
 import cloudinary.uploader
 
+# pybase64 wraps libbase64's SIMD (AVX2/SSSE3/NEON) decoder — a drop-in
+# replacement that is several times faster on the MB-sized webcam frames
+# we receive. Fall back to the stdlib if it isn't installed.
+try:
+    import pybase64 as _base64
+except ImportError:
+    _base64 = base64
+
 # Load .env file so credentials are available via os.getenv()
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 
@@ -76,11 +100,39 @@ TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM", "whatsapp:+14155238886"
 # Optional pre-approved Content template SID
 TWILIO_CONTENT_SID   = os.getenv("TWILIO_CONTENT_SID",   "")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One keep-alive connection pool for all liveness calls — creating an
+    # AsyncClient per request paid TCP (and pool) setup on every /recognize
+    app.state.liveness_client = httpx.AsyncClient(
+        timeout=10.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+    )
+
+    # Warm the face_recognition/dlib stack with one throwaway encode so the
+    # model weights are paged in at boot rather than on the first /recognize
+    # (which otherwise pays a multi-second cold start). Noise instead of a
+    # flat image so the degenerate-image guard doesn't skip the detector.
+    if embedding_service is not None:
+        try:
+            noise = np.random.default_rng(0).integers(0, 256, (160, 160, 3), dtype=np.uint8)
+            buffer = io.BytesIO()
+            Image.fromarray(noise).save(buffer, format='JPEG')
+            await asyncio.to_thread(embedding_service.extract_face_encoding, buffer.getvalue())
+            print("✅ Face recognition model warmed up")
+        except Exception as e:
+            print(f"⚠️ Model warm-up failed (first request will be slow): {e}")
+
+    yield
+    await app.state.liveness_client.aclose()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Face Recognition Attendance API",
     description="Backend API for Face Recognition Attendance System",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=DefaultJSONResponse,
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -185,6 +237,117 @@ class MarkAttendanceBatchResponse(BaseModel):
     message: str
     error: Optional[str] = None
 
+# Short-TTL response cache with ETags for the read-only endpoints
+# (/classes/{id}/students and /reports/**). Repeated report views within
+# the window skip Firestore entirely, and clients sending If-None-Match
+# get an empty 304. Cleared on any attendance/training write. LRU-bounded
+# like _recognition_cache: report keys include client-controlled date
+# strings, so an unbounded dict would let a filter scan pile up payloads.
+_RESPONSE_CACHE_TTL = 30.0
+_RESPONSE_CACHE_SIZE = 1024
+_response_cache: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (expires_at, etag, payload)
+
+def _response_cache_get(key: tuple) -> Optional[tuple]:
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, etag, payload = entry
+    if time.monotonic() > expires_at:
+        _response_cache.pop(key, None)
+        return None
+    _response_cache.move_to_end(key)
+    return etag, payload
+
+def _response_cache_put(key: tuple, payload: dict) -> str:
+    serialized = json.dumps(payload, sort_keys=True, default=str).encode()
+    etag = hashlib.blake2b(serialized, digest_size=8).hexdigest()
+    _response_cache[key] = (time.monotonic() + _RESPONSE_CACHE_TTL, etag, payload)
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > _RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+    return etag
+
+def _response_cache_clear():
+    _response_cache.clear()
+
+# Recognition result cache keyed by (classId, perceptual hash).
+# Live scanning sends near-identical consecutive frames of the same face;
+# a 64-bit dHash lets us return the previous result for those frames
+# without re-running detection + embedding. Entries expire after a short
+# TTL (scanning bursts last seconds) and are dropped when the class is
+# retrained.
+_RECOGNITION_CACHE_SIZE = 256
+_RECOGNITION_CACHE_MAX_HAMMING = 4
+_RECOGNITION_CACHE_TTL = 5.0
+_recognition_cache: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (expires_at, result)
+
+def _image_dhash(image_data: bytes) -> int:
+    """64-bit difference hash (9x8 grayscale gradient) of a frame"""
+    image = Image.open(io.BytesIO(image_data)).convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+def _recognition_cache_get(class_id: str, frame_hash: int) -> Optional[dict]:
+    """Return a live cached result for a frame within the Hamming-distance budget"""
+    now = time.monotonic()
+    expired = []
+    hit = None
+    for key, (expires_at, result) in _recognition_cache.items():
+        if now > expires_at:
+            expired.append(key)
+            continue
+        cached_class_id, cached_hash = key
+        if hit is None and cached_class_id == class_id \
+                and bin(cached_hash ^ frame_hash).count('1') <= _RECOGNITION_CACHE_MAX_HAMMING:
+            hit = result
+    for key in expired:
+        del _recognition_cache[key]
+    return hit
+
+def _recognition_cache_put(class_id: str, frame_hash: int, result: dict):
+    _recognition_cache[(class_id, frame_hash)] = (time.monotonic() + _RECOGNITION_CACHE_TTL, result)
+    while len(_recognition_cache) > _RECOGNITION_CACHE_SIZE:
+        _recognition_cache.popitem(last=False)
+
+def _recognition_cache_invalidate(class_id: str):
+    """Drop cached results for a class (call after retraining)"""
+    for key in [k for k in _recognition_cache if k[0] == class_id]:
+        del _recognition_cache[key]
+
+def _decode_image_base64(base64_string: str) -> bytes:
+    """
+    Decode a (possibly data-URL prefixed) base64 image string to bytes.
+    Runs synchronously — call via asyncio.to_thread from endpoints so
+    multi-MB webcam frames don't stall the event loop.
+    """
+    if base64_string.startswith('data:image'):
+        # The data-URL prefix lives in the first few dozen chars; a bounded
+        # find + single slice avoids split()'s extra prefix allocation on
+        # multi-MB payloads.
+        idx = base64_string.find(',', 0, 128)
+        if idx != -1:
+            base64_string = base64_string[idx + 1:]
+    return _base64.b64decode(base64_string)
+
+# A real webcam frame is far bigger than this; tiny payloads are camera-race
+# artifacts from the frontend and not worth a liveness RTT or a dlib pass
+_MIN_IMAGE_BYTES = 512
+
+def _validate_image_bytes(image_data: bytes):
+    """
+    Reject obviously-invalid frames before the liveness HTTP call and
+    recognition work: too small, or not JPEG/PNG/WebP by magic bytes.
+    Raises HTTPException(400) on garbage input.
+    """
+    if len(image_data) < _MIN_IMAGE_BYTES:
+        raise HTTPException(status_code=400, detail="Image data too small to be a valid frame")
+    is_jpeg = image_data[:3] == b'\xff\xd8\xff'
+    is_png = image_data[:4] == b'\x89PNG'
+    is_webp = image_data[:4] == b'RIFF' and image_data[8:12] == b'WEBP'
+    if not (is_jpeg or is_png or is_webp):
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image format")
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -241,35 +404,147 @@ async def get_training_status(class_id: str):
         }
 
 
+# Training is O(students × jitters × CNN) — a double-click or two open
+# sessions firing /train for the same class would run it all twice.
+# Per-class locks make duplicates wait; a short result cache lets the
+# waiter (and any retry inside the TTL) reuse the finished outcome.
+_TRAIN_RESULT_TTL = 60.0
+_train_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+_train_results: Dict[str, tuple] = {}  # class_id -> (expires_at, response)
+
 @app.post("/train", response_model=TrainResponse)
 async def train_class(request: TrainRequest):
     """
     Train face recognition model for a specific class.
     Downloads student photos and generates face embeddings.
+    Concurrent calls for the same class share one training run.
     """
     try:
-        print(f"Starting training for class: {request.classId}")
-        
-        # Get students from the class
-        students = await firebase_service.get_class_students(request.classId)
-        if not students:
-            raise HTTPException(status_code=404, detail="No students found in class")
-        
-        print(f"Found {len(students)} students to process")
-        
-        # Generate embeddings for all students
-        processed_count = await recognition_service.train_class_embeddings(request.classId, students)
-        
-        return TrainResponse(
-            success=True,
-            message=f"Successfully trained embeddings for {processed_count} students",
-            studentsProcessed=processed_count
-        )
-        
+        async with _train_locks[request.classId]:
+            cached = _train_results.get(request.classId)
+            if cached is not None and cached[0] > time.monotonic():
+                print(f"Returning recent training result for class: {request.classId}")
+                return cached[1]
+
+            print(f"Starting training for class: {request.classId}")
+
+            # Get students from the class
+            students = await firebase_service.get_class_students(request.classId)
+            if not students:
+                raise HTTPException(status_code=404, detail="No students found in class")
+
+            print(f"Found {len(students)} students to process")
+
+            # Generate embeddings for all students
+            processed_count = await recognition_service.train_class_embeddings(request.classId, students)
+
+            # Retraining changes the gallery — cached frame results are stale
+            _recognition_cache_invalidate(request.classId)
+            _response_cache_clear()
+
+            response = TrainResponse(
+                success=True,
+                message=f"Successfully trained embeddings for {processed_count} students",
+                studentsProcessed=processed_count
+            )
+            _train_results[request.classId] = (time.monotonic() + _TRAIN_RESULT_TTL, response)
+            return response
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in train endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Training failed: {str(e)}")
 
+async def _check_liveness(image_data: bytes) -> Optional[dict]:
+    """
+    POST a decoded frame to the liveness service.
+    Returns the liveness result dict, or None when the service is
+    unreachable or errors (recognition proceeds without liveness).
+    """
+    try:
+        # Forward the already-decoded bytes — re-sending the base64
+        # string as JSON shipped ~33% more body and forced the
+        # liveness side to json-parse and base64-decode it again
+        client = app.state.liveness_client
+        liveness_response = await client.post(
+            f"{LIVENESS_SERVICE_URL}/liveness/check",
+            content=image_data,
+            headers={"Content-Type": "application/octet-stream"}
+        )
+
+        if liveness_response.status_code == 200:
+            liveness_result = liveness_response.json()
+            print(f"Liveness check: is_live={liveness_result.get('is_live')}, confidence={liveness_result.get('confidence')}")
+            return liveness_result
+
+        print(f"Liveness service returned status {liveness_response.status_code}")
+    except httpx.ConnectError:
+        print("⚠️ Liveness service not available, proceeding without liveness check")
+    except Exception as e:
+        print(f"⚠️ Liveness check error: {e}, proceeding without liveness check")
+    return None
+
+async def _recognize_with_cache(class_id: str, image_data: bytes) -> dict:
+    """Run face recognition, serving near-duplicate frames from the cache"""
+    frame_hash = None
+    result = None
+    try:
+        frame_hash = await asyncio.to_thread(_image_dhash, image_data)
+        result = _recognition_cache_get(class_id, frame_hash)
+        if result is not None:
+            print(f"Recognition cache hit for class {class_id}")
+    except Exception as e:
+        print(f"Frame hash error: {e}")
+
+    if result is None:
+        result = await recognition_service.recognize_face(class_id, image_data)
+        if frame_hash is not None and "error" not in result:
+            _recognition_cache_put(class_id, frame_hash, result)
+    return result
+
+async def _run_recognition(class_id: str, image_data: bytes) -> RecognizeResponse:
+    """Shared liveness + recognition pipeline for the decoded frame bytes."""
+    # Liveness and recognition are independent given the frame, so run
+    # them concurrently: end-to-end latency becomes max(liveness,
+    # recognition) instead of their sum. The recognition result is
+    # simply discarded when the frame turns out to be a spoof.
+    recognition_task = asyncio.create_task(
+        _recognize_with_cache(class_id, image_data)
+    )
+
+    liveness_result = None
+    if LIVENESS_ENABLED:
+        liveness_result = await _check_liveness(image_data)
+
+        # If not live, return early with spoof detection
+        if liveness_result is not None and not liveness_result.get('is_live', False):
+            print("⚠️ Spoof detected - liveness check failed")
+            recognition_task.cancel()
+            try:
+                await recognition_task
+            except asyncio.CancelledError:
+                pass
+            return RecognizeResponse(
+                matched=False,
+                confidence=0.0,
+                is_live=False,
+                liveness_confidence=liveness_result.get('confidence', 0.0),
+                liveness_checks=liveness_result.get('checks')
+            )
+
+    result = await recognition_task
+
+    return RecognizeResponse(
+        matched=result["matched"],
+        studentId=result.get("studentId"),
+        studentName=result.get("studentName"),
+        confidence=result.get("confidence", 0.0),
+        is_live=liveness_result.get('is_live') if liveness_result else None,
+        liveness_confidence=liveness_result.get('confidence') if liveness_result else None,
+        liveness_checks=liveness_result.get('checks') if liveness_result else None
+    )
+
 @app.post("/recognize", response_model=RecognizeResponse)
 async def recognize_face(request: RecognizeRequest):
     """
@@ -279,67 +554,48 @@ async def recognize_face(request: RecognizeRequest):
     """
     try:
         print(f"Processing recognition request for class: {request.classId}")
-        
-        # Decode base64 image
+
+        # Decode base64 image (off the event loop — frames can be several MB)
         try:
-            base64_string = request.image_base64
-            if base64_string.startswith('data:image'):
-                base64_string = base64_string.split(',', 1)[1]
-            
-            image_data = base64.b64decode(base64_string)
+            image_data = await asyncio.to_thread(_decode_image_base64, request.image_base64)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid base64 image data: {str(e)}")
-        
-        # Step 1: Perform liveness check (if enabled)
-        liveness_result = None
-        if LIVENESS_ENABLED:
-            try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    liveness_response = await client.post(
-                        f"{LIVENESS_SERVICE_URL}/liveness/check",
-                        json={"image_base64": request.image_base64}
-                    )
-                    
-                    if liveness_response.status_code == 200:
-                        liveness_result = liveness_response.json()
-                        print(f"Liveness check: is_live={liveness_result.get('is_live')}, confidence={liveness_result.get('confidence')}")
-                        
-                        # If not live, return early with spoof detection
-                        if not liveness_result.get('is_live', False):
-                            print("⚠️ Spoof detected - liveness check failed")
-                            return RecognizeResponse(
-                                matched=False,
-                                confidence=0.0,
-                                is_live=False,
-                                liveness_confidence=liveness_result.get('confidence', 0.0),
-                                liveness_checks=liveness_result.get('checks')
-                            )
-                    else:
-                        print(f"Liveness service returned status {liveness_response.status_code}")
-            except httpx.ConnectError:
-                print("⚠️ Liveness service not available, proceeding without liveness check")
-            except Exception as e:
-                print(f"⚠️ Liveness check error: {e}, proceeding without liveness check")
-        
-        # Step 2: Perform face recognition
-        result = await recognition_service.recognize_face(request.classId, image_data)
-        
-        return RecognizeResponse(
-            matched=result["matched"],
-            studentId=result.get("studentId"),
-            studentName=result.get("studentName"),
-            confidence=result.get("confidence", 0.0),
-            is_live=liveness_result.get('is_live') if liveness_result else None,
-            liveness_confidence=liveness_result.get('confidence') if liveness_result else None,
-            liveness_checks=liveness_result.get('checks') if liveness_result else None
-        )
-        
+
+        _validate_image_bytes(image_data)
+
+        return await _run_recognition(request.classId, image_data)
+
     except HTTPException:
         raise
     except Exception as e:
         print(f"Error in recognize endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Recognition failed: {str(e)}")
 
+@app.post("/recognize/upload", response_model=RecognizeResponse)
+async def recognize_face_upload(
+    image: UploadFile = File(...),
+    classId: str = Form(...)
+):
+    """
+    Recognize a face from a multipart upload.
+    Same pipeline as /recognize but takes the frame as a binary file part,
+    skipping the ~33% base64 inflation and the decode step entirely.
+    The JSON endpoint stays for existing clients.
+    """
+    try:
+        print(f"Processing recognition upload for class: {classId}")
+
+        image_data = await image.read()
+        _validate_image_bytes(image_data)
+
+        return await _run_recognition(classId, image_data)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in recognize upload endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Recognition failed: {str(e)}")
+
 @app.post("/recognize_batch", response_model=BatchRecognizeResponse)
 async def recognize_batch(request: BatchRecognizeRequest):
     """
@@ -351,15 +607,14 @@ async def recognize_batch(request: BatchRecognizeRequest):
     try:
         print(f"Processing batch recognition request for class: {request.classId}")
 
-        # Decode base64 image
+        # Decode base64 image (off the event loop — frames can be several MB)
         try:
-            base64_string = request.image_base64
-            if base64_string.startswith('data:image'):
-                base64_string = base64_string.split(',', 1)[1]
-            image_data = base64.b64decode(base64_string)
+            image_data = await asyncio.to_thread(_decode_image_base64, request.image_base64)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid base64 image data: {str(e)}")
 
+        _validate_image_bytes(image_data)
+
         # Run batch recognition
         result = await recognition_service.recognize_all_faces(request.classId, image_data)
 
@@ -414,6 +669,7 @@ async def mark_attendance_batch(request: MarkAttendanceBatchRequest):
         result = await firebase_service.mark_multiple_students_attendance(
             request.classId, request.studentIds
         )
+        _response_cache_clear()
 
         return MarkAttendanceBatchResponse(
             success=True,
@@ -425,18 +681,69 @@ async def mark_attendance_batch(request: MarkAttendanceBatchRequest):
         print(f"Error in mark_attendance_batch: {e}")
         raise HTTPException(status_code=500, detail=f"Batch mark failed: {str(e)}")
 
+class AttendanceBatcher:
+    """
+    Coalesce concurrent single-student /mark_attendance calls into one
+    transactional Firestore write per class. During a scan the frontend can
+    fire several marks within tens of milliseconds; each one is a full
+    read-modify-write on the class document, and Firestore caps sustained
+    writes to a single doc at ~1/s. Submissions collect for a short window,
+    then flush in a single mark_multiple_students_attendance transaction
+    and each caller's future resolves with its own student's result.
+    """
+
+    def __init__(self, window: float = 0.05):
+        self.window = window
+        self._pending: Dict[str, list] = {}  # class_id -> [(student_id, future), ...]
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, class_id: str, student_id: str) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(class_id, []).append((student_id, future))
+        if class_id not in self._flush_tasks:
+            self._flush_tasks[class_id] = asyncio.create_task(self._flush_after_window(class_id))
+        return await future
+
+    async def _flush_after_window(self, class_id: str):
+        await asyncio.sleep(self.window)
+        pending = self._pending.pop(class_id, [])
+        self._flush_tasks.pop(class_id, None)
+        if not pending:
+            return
+
+        student_ids = list(dict.fromkeys(sid for sid, _ in pending))
+        try:
+            result = await firebase_service.mark_multiple_students_attendance(class_id, student_ids)
+            marked_by_id = result.get('markedStudentsById', {})
+            for student_id, future in pending:
+                if future.done():
+                    continue
+                if student_id in marked_by_id:
+                    future.set_result({'studentName': marked_by_id[student_id], 'date': result.get('date')})
+                else:
+                    # Matches the single-write path: unknown IDs surface as errors
+                    future.set_exception(Exception(f"Student {student_id} not found in class"))
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+
+_attendance_batcher = AttendanceBatcher()
+
 @app.post("/mark_attendance", response_model=MarkAttendanceResponse)
 async def mark_attendance(request: MarkAttendanceRequest):
     """
     Mark attendance for a student in a class.
     Updates the attendance record for today's date.
+    Concurrent calls for the same class are coalesced into one write.
     """
     try:
         print(f"Marking attendance for student {request.studentId} in class {request.classId}")
-        
-        # Mark attendance in Firebase
-        result = await firebase_service.mark_student_attendance(request.classId, request.studentId)
-        
+
+        # Mark attendance in Firebase (coalesced with concurrent marks)
+        result = await _attendance_batcher.submit(request.classId, request.studentId)
+        _response_cache_clear()
+
         return MarkAttendanceResponse(
             success=True,
             message=f"Attendance marked successfully for {result.get('studentName', 'student')}",
@@ -447,14 +754,22 @@ async def mark_attendance(request: MarkAttendanceRequest):
         print(f"Error in mark_attendance endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to mark attendance: {str(e)}")
 
+# Load balancers poll /health frequently; cache the response for a second
+# so the Firebase check_connection RPC runs at most ~1/s
+_health_cache = {'t': 0.0, 'v': None}
+
 @app.get("/health")
 async def health_check():
     """Extended health check with service status"""
+    now = time.monotonic()
+    if _health_cache['v'] is not None and now - _health_cache['t'] < 1.0:
+        return _health_cache['v']
+
     try:
         # Check Firebase connection
         firebase_status = await firebase_service.check_connection()
-        
-        return {
+
+        result = {
             "status": "healthy",
             "timestamp": datetime.now().isoformat(),
             "services": {
@@ -464,33 +779,59 @@ async def health_check():
             }
         }
     except Exception as e:
-        return {
+        result = {
             "status": "unhealthy",
             "error": str(e),
             "timestamp": datetime.now().isoformat()
         }
 
+    _health_cache['t'] = now
+    _health_cache['v'] = result
+    return result
+
 @app.get("/classes/{class_id}/students")
-async def get_class_students(class_id: str):
+async def get_class_students(class_id: str, request: Request, response: Response):
     """Get all students in a class (for debugging)"""
     try:
+        cache_key = ('class_students', class_id)
+        cached = _response_cache_get(cache_key)
+        if cached is not None:
+            etag, payload = cached
+            if request.headers.get('if-none-match') == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+            return payload
+
         students = await firebase_service.get_class_students(class_id)
-        return {
+        payload = {
             "classId": class_id,
             "students": students,
             "count": len(students)
         }
+        response.headers["ETag"] = _response_cache_put(cache_key, payload)
+        return payload
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/reports/classes/{class_id}")
 async def get_class_report(
     class_id: str,
+    request: Request,
+    response: Response,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ):
     """Generate detailed attendance report for a class"""
     try:
+        cache_key = ('class_report', class_id, start_date, end_date)
+        cached = _response_cache_get(cache_key)
+        if cached is not None:
+            etag, payload = cached
+            if request.headers.get('if-none-match') == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+            return payload
+
         # Get class data from Firebase
         class_data = await firebase_service.get_class_data(class_id)
         if not class_data:
@@ -517,7 +858,7 @@ async def get_class_report(
         total_sessions = len(attendance_records)
         
         if total_sessions == 0:
-            return {
+            payload = {
                 "classId": class_id,
                 "className": class_data.get('name', 'Unknown'),
                 "subject": class_data.get('subject', 'Unknown'),
@@ -527,52 +868,68 @@ async def get_class_report(
                 "sessions": [],
                 "studentStats": []
             }
+            response.headers["ETag"] = _response_cache_put(cache_key, payload)
+            return payload
         
-        # Calculate session-wise attendance
-        session_stats = []
-        total_attendance_percentage = 0
-        
-        for record in attendance_records:
-            present_count = len(record.get('presentStudents', []))
-            absent_count = total_students - present_count
-            attendance_percentage = (present_count / total_students * 100) if total_students > 0 else 0
-            
-            session_stats.append({
+        # Build a (sessions x students) boolean presence matrix once; all the
+        # per-session and per-student sums/percentages then collapse to
+        # C-level NumPy reductions instead of nested Python loops.
+        present_sets = [frozenset(r.get('presentStudents', ())) for r in attendance_records]
+        sid_to_col = {s.get('id'): j for j, s in enumerate(students)}
+        presence = np.zeros((total_sessions, total_students), dtype=bool)
+        for i, present in enumerate(present_sets):
+            for sid in present:
+                j = sid_to_col.get(sid)
+                if j is not None:
+                    presence[i, j] = True
+
+        # Session counts use the raw set sizes so stale IDs (students removed
+        # after the session) are still counted, matching the stored records
+        present_per_session = np.fromiter((len(p) for p in present_sets), dtype=np.int64, count=total_sessions)
+        if total_students > 0:
+            session_percentages = present_per_session * (100.0 / total_students)
+        else:
+            session_percentages = np.zeros(total_sessions)
+
+        session_stats = [
+            {
                 "date": record.get('date'),
                 "totalStudents": total_students,
                 "presentStudents": present_count,
-                "absentStudents": absent_count,
-                "attendancePercentage": round(attendance_percentage, 2)
-            })
-            
-            total_attendance_percentage += attendance_percentage
-        
-        average_attendance = round(total_attendance_percentage / total_sessions, 2)
-        
+                "absentStudents": total_students - present_count,
+                "attendancePercentage": pct
+            }
+            for record, present_count, pct in zip(
+                attendance_records,
+                present_per_session.tolist(),
+                np.round(session_percentages, 2).tolist()
+            )
+        ]
+
+        average_attendance = round(float(session_percentages.sum()) / total_sessions, 2)
+
         # Calculate student-wise statistics
-        student_stats = []
-        for student in students:
-            student_id = student.get('id')
-            present_sessions = 0
-            
-            for record in attendance_records:
-                if student_id in record.get('presentStudents', []):
-                    present_sessions += 1
-            
-            absent_sessions = total_sessions - present_sessions
-            student_attendance_percentage = (present_sessions / total_sessions * 100) if total_sessions > 0 else 0
-            
-            student_stats.append({
-                "studentId": student_id,
+        present_per_student = presence.sum(axis=0)
+        student_percentages = np.round(present_per_student * (100.0 / total_sessions), 2)
+
+        student_stats = [
+            {
+                "studentId": student.get('id'),
                 "studentName": student.get('name', 'Unknown'),
                 "studentSrn": student.get('srn', ''),
                 "totalSessions": total_sessions,
                 "presentSessions": present_sessions,
-                "absentSessions": absent_sessions,
-                "attendancePercentage": round(student_attendance_percentage, 2)
-            })
+                "absentSessions": total_sessions - present_sessions,
+                "attendancePercentage": pct
+            }
+            for student, present_sessions, pct in zip(
+                students,
+                present_per_student.tolist(),
+                student_percentages.tolist()
+            )
+        ]
         
-        return {
+        payload = {
             "classId": class_id,
             "className": class_data.get('name', 'Unknown'),
             "subject": class_data.get('subject', 'Unknown'),
@@ -586,6 +943,8 @@ async def get_class_report(
             "sessions": session_stats,
             "studentStats": student_stats
         }
+        response.headers["ETag"] = _response_cache_put(cache_key, payload)
+        return payload
         
     except HTTPException:
         raise
@@ -594,9 +953,18 @@ async def get_class_report(
         raise HTTPException(status_code=500, detail=f"Failed to generate report: {str(e)}")
 
 @app.get("/reports/summary/{teacher_id}")
-async def get_teacher_summary(teacher_id: str):
+async def get_teacher_summary(teacher_id: str, request: Request, response: Response):
     """Get summary statistics for all classes of a teacher"""
     try:
+        cache_key = ('teacher_summary', teacher_id)
+        cached = _response_cache_get(cache_key)
+        if cached is not None:
+            etag, payload = cached
+            if request.headers.get('if-none-match') == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+            return payload
+
         # Get all classes for the teacher
         classes = await firebase_service.get_teacher_classes(teacher_id)
         
@@ -607,33 +975,27 @@ async def get_teacher_summary(teacher_id: str):
         class_summaries = []
         
         for class_data in classes:
+            records = class_data.get('attendanceRecords', [])
             class_students = len(class_data.get('students', []))
-            class_sessions = len(class_data.get('attendanceRecords', []))
+            class_sessions = len(records)
             total_students += class_students
             total_sessions += class_sessions
-            
-            # Calculate class average attendance
-            if class_sessions > 0:
-                class_attendance_sum = 0
-                for record in class_data.get('attendanceRecords', []):
-                    present_count = len(record.get('presentStudents', []))
-                    if class_students > 0:
-                        class_attendance_sum += (present_count / class_students * 100)
-                
-                class_average = class_attendance_sum / class_sessions
+
+            # Class average attendance as one vectorized pass over the
+            # per-session present counts
+            if class_sessions > 0 and class_students > 0:
+                present_counts = np.fromiter(
+                    (len(r.get('presentStudents', [])) for r in records),
+                    dtype=np.int64, count=class_sessions
+                )
+                class_average = float(present_counts.mean()) * (100.0 / class_students)
                 total_attendance_percentage += class_average
             else:
                 class_average = 0
             
-            # Get last session date
-            last_session_date = None
-            if class_data.get('attendanceRecords'):
-                sorted_records = sorted(
-                    class_data.get('attendanceRecords', []), 
-                    key=lambda x: x.get('date', ''), 
-                    reverse=True
-                )
-                last_session_date = sorted_records[0].get('date') if sorted_records else None
+            # Get last session date (single linear max, no O(R log R) sort)
+            last_record = max(records, key=lambda x: x.get('date', ''), default=None)
+            last_session_date = last_record.get('date') if last_record else None
             
             class_summaries.append({
                 "classId": class_data.get('id'),
@@ -647,7 +1009,7 @@ async def get_teacher_summary(teacher_id: str):
         
         overall_average = (total_attendance_percentage / total_classes) if total_classes > 0 else 0
         
-        return {
+        payload = {
             "teacherId": teacher_id,
             "totalClasses": total_classes,
             "totalStudents": total_students,
@@ -655,6 +1017,8 @@ async def get_teacher_summary(teacher_id: str):
             "averageAttendance": round(overall_average, 2),
             "classSummaries": class_summaries
         }
+        response.headers["ETag"] = _response_cache_put(cache_key, payload)
+        return payload
         
     except Exception as e:
         print(f"Error getting teacher summary: {str(e)}")
@@ -678,12 +1042,10 @@ async def get_config():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/config/threshold")
-async def update_threshold(threshold: float):
+async def update_threshold(threshold: float = Query(..., ge=0.0, le=1.0)):
     """Update recognition threshold (0.0-1.0, lower = stricter)"""
     try:
-        if not 0.0 <= threshold <= 1.0:
-            raise HTTPException(status_code=400, detail="Threshold must be between 0.0 and 1.0")
-        
+        # Range is enforced by the cached Query validator (422 on violation)
         recognition_service.set_recognition_threshold(threshold)
         return {
             "success": True,
@@ -694,12 +1056,9 @@ async def update_threshold(threshold: float):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/config/model")
-async def update_model(model: str):
+async def update_model(model: str = Query(..., pattern="^(cnn|hog)$")):
     """Update face detection model (cnn or hog)"""
     try:
-        if model not in ["cnn", "hog"]:
-            raise HTTPException(status_code=400, detail="Model must be 'cnn' or 'hog'")
-        
         embedding_service.face_detection_model = model
         return {
             "success": True,
@@ -710,12 +1069,9 @@ async def update_model(model: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/config/jitters")
-async def update_jitters(jitters: int):
+async def update_jitters(jitters: int = Query(..., ge=1, le=20)):
     """Update number of jitters for encoding (1-20, higher = more accurate but slower)"""
     try:
-        if not 1 <= jitters <= 20:
-            raise HTTPException(status_code=400, detail="Jitters must be between 1 and 20")
-        
         embedding_service.num_jitters = jitters
         return {
             "success": True,
@@ -784,7 +1140,7 @@ async def send_absence_notifications(request: NotificationRequest):
                         "date": request.date,
                     })
             if email_notifications:
-                email_results = email_service.send_bulk_absence_notifications(
+                email_results = await email_service.send_bulk_absence_notifications_async(
                     email_notifications, teacher_name=request.teacherName
                 )
                 for r in email_results:
@@ -1,28 +1,15 @@
 """
 Email notification service using Resend API
 """
+import asyncio
 import resend
+from string import Template
 from typing import Optional, List
 import os
 
-class EmailService:
-    def __init__(self, api_key: str):
-        """Initialize the email service with Resend API key"""
-        resend.api_key = api_key
-        self.from_email = "IDGuard <onboarding@resend.dev>"  # Default Resend sender
-    
-    def send_absence_notification(
-        self,
-        parent_email: str,
-        student_name: str,
-        class_name: str,
-        subject_name: str,
-        date: str,
-        teacher_name: str = "Your Teacher"
-    ) -> dict:
-        """Send absence notification email to parent"""
-        
-        html_content = f"""
+# Compiled once at import — bulk sends render one ~3KB body per recipient,
+# and Template.substitute skips the per-call f-string evaluation machinery
+_ABSENCE_TEMPLATE = Template("""
         <!DOCTYPE html>
         <html>
         <head>
@@ -42,52 +29,52 @@ class EmailService:
                             <span style="font-size: 20px; font-weight: 700; color: #0f172a;">IDGuard</span>
                         </div>
                     </div>
-                    
+
                     <!-- Content -->
                     <h1 style="color: #0f172a; font-size: 24px; font-weight: 600; margin: 0 0 16px 0; text-align: center;">
                         Absence Notification
                     </h1>
-                    
+
                     <p style="color: #475569; font-size: 16px; line-height: 1.6; margin: 0 0 24px 0;">
                         Dear Parent/Guardian,
                     </p>
-                    
+
                     <p style="color: #475569; font-size: 16px; line-height: 1.6; margin: 0 0 24px 0;">
                         This is to inform you that your child was marked <strong style="color: #dc2626;">absent</strong> from class today.
                     </p>
-                    
+
                     <!-- Details Box -->
                     <div style="background-color: #f8fafc; border-radius: 8px; padding: 20px; margin-bottom: 24px;">
                         <table style="width: 100%; border-collapse: collapse;">
                             <tr>
                                 <td style="padding: 8px 0; color: #64748b; font-size: 14px;">Student Name</td>
-                                <td style="padding: 8px 0; color: #0f172a; font-size: 14px; font-weight: 600; text-align: right;">{student_name}</td>
+                                <td style="padding: 8px 0; color: #0f172a; font-size: 14px; font-weight: 600; text-align: right;">$student_name</td>
                             </tr>
                             <tr>
                                 <td style="padding: 8px 0; color: #64748b; font-size: 14px;">Class</td>
-                                <td style="padding: 8px 0; color: #0f172a; font-size: 14px; font-weight: 600; text-align: right;">{class_name}</td>
+                                <td style="padding: 8px 0; color: #0f172a; font-size: 14px; font-weight: 600; text-align: right;">$class_name</td>
                             </tr>
                             <tr>
                                 <td style="padding: 8px 0; color: #64748b; font-size: 14px;">Subject</td>
-                                <td style="padding: 8px 0; color: #0f172a; font-size: 14px; font-weight: 600; text-align: right;">{subject_name}</td>
+                                <td style="padding: 8px 0; color: #0f172a; font-size: 14px; font-weight: 600; text-align: right;">$subject_name</td>
                             </tr>
                             <tr>
                                 <td style="padding: 8px 0; color: #64748b; font-size: 14px;">Date</td>
-                                <td style="padding: 8px 0; color: #0f172a; font-size: 14px; font-weight: 600; text-align: right;">{date}</td>
+                                <td style="padding: 8px 0; color: #0f172a; font-size: 14px; font-weight: 600; text-align: right;">$date</td>
                             </tr>
                         </table>
                     </div>
-                    
+
                     <p style="color: #475569; font-size: 16px; line-height: 1.6; margin: 0 0 24px 0;">
                         If you believe this is an error or have any questions, please contact the class teacher.
                     </p>
-                    
+
                     <p style="color: #475569; font-size: 16px; line-height: 1.6; margin: 0;">
                         Best regards,<br>
-                        <strong style="color: #0f172a;">{teacher_name}</strong>
+                        <strong style="color: #0f172a;">$teacher_name</strong>
                     </p>
                 </div>
-                
+
                 <!-- Footer -->
                 <div style="text-align: center; margin-top: 24px;">
                     <p style="color: #94a3b8; font-size: 12px; margin: 0;">
@@ -97,40 +84,157 @@ class EmailService:
             </div>
         </body>
         </html>
-        """
-        
+        """)
+
+class EmailService:
+    # Resend's batch endpoint accepts up to 100 messages per call
+    BATCH_SIZE = 100
+
+    def __init__(self, api_key: str):
+        """Initialize the email service with Resend API key"""
+        resend.api_key = api_key
+        self.from_email = "IDGuard <onboarding@resend.dev>"  # Default Resend sender
+    
+    def _render_absence_html(
+        self,
+        student_name: str,
+        class_name: str,
+        subject_name: str,
+        date: str,
+        teacher_name: str
+    ) -> str:
+        """Render the absence notification HTML body"""
+        return _ABSENCE_TEMPLATE.substitute(
+            student_name=student_name,
+            class_name=class_name,
+            subject_name=subject_name,
+            date=date,
+            teacher_name=teacher_name
+        )
+
+    def _build_absence_params(self, notif: dict, teacher_name: str) -> dict:
+        """Build the Resend send params for one absence notification"""
+        return {
+            "from": self.from_email,
+            "to": [notif["parent_email"]],
+            "subject": f"Absence Alert: {notif['student_name']} - {notif['class_name']}",
+            "html": self._render_absence_html(
+                student_name=notif["student_name"],
+                class_name=notif["class_name"],
+                subject_name=notif["subject_name"],
+                date=notif["date"],
+                teacher_name=teacher_name
+            )
+        }
+
+    def send_absence_notification(
+        self,
+        parent_email: str,
+        student_name: str,
+        class_name: str,
+        subject_name: str,
+        date: str,
+        teacher_name: str = "Your Teacher"
+    ) -> dict:
+        """Send absence notification email to parent"""
         try:
-            params = {
-                "from": self.from_email,
-                "to": [parent_email],
-                "subject": f"Absence Alert: {student_name} - {class_name}",
-                "html": html_content
-            }
-            
+            params = self._build_absence_params({
+                "parent_email": parent_email,
+                "student_name": student_name,
+                "class_name": class_name,
+                "subject_name": subject_name,
+                "date": date
+            }, teacher_name)
+
             response = resend.Emails.send(params)
             return {"success": True, "id": response.get("id"), "message": "Email sent successfully"}
         except Exception as e:
             return {"success": False, "error": str(e)}
-    
-    def send_bulk_absence_notifications(
-        self,
-        notifications: List[dict],
-        teacher_name: str = "Your Teacher"
-    ) -> List[dict]:
-        """Send multiple absence notifications"""
-        results = []
-        for notif in notifications:
-            if notif.get("parent_email"):
-                result = self.send_absence_notification(
-                    parent_email=notif["parent_email"],
-                    student_name=notif["student_name"],
+
+    def _build_bulk_params(self, chunk: List[dict], teacher_name: str) -> List[dict]:
+        """
+        Build send params for a batch, rendering shared HTML once per
+        (class, subject, date) group. Within a group only the student name
+        varies, so the ~3KB body renders once and each recipient costs a
+        single small join instead of a full template pass.
+        """
+        group_cache = {}
+        params = []
+        for notif in chunk:
+            key = (notif["class_name"], notif["subject_name"], notif["date"])
+            halves = group_cache.get(key)
+            if halves is None:
+                shared = _ABSENCE_TEMPLATE.safe_substitute(
                     class_name=notif["class_name"],
                     subject_name=notif["subject_name"],
                     date=notif["date"],
                     teacher_name=teacher_name
                 )
-                results.append({
+                halves = shared.split('$student_name')
+                group_cache[key] = halves
+            params.append({
+                "from": self.from_email,
+                "to": [notif["parent_email"]],
+                "subject": f"Absence Alert: {notif['student_name']} - {notif['class_name']}",
+                "html": notif["student_name"].join(halves)
+            })
+        return params
+
+    def _send_batch_chunk(self, chunk: List[dict], teacher_name: str) -> List[dict]:
+        """Send up to BATCH_SIZE notifications in one Resend batch call"""
+        try:
+            batch_params = self._build_bulk_params(chunk, teacher_name)
+            response = resend.Batch.send(batch_params)
+            sent = response.get("data", []) if isinstance(response, dict) else []
+            return [
+                {
                     "student_name": notif["student_name"],
-                    **result
-                })
+                    "success": True,
+                    "id": sent[i].get("id") if i < len(sent) else None,
+                    "message": "Email sent successfully"
+                }
+                for i, notif in enumerate(chunk)
+            ]
+        except Exception as e:
+            return [
+                {"student_name": notif["student_name"], "success": False, "error": str(e)}
+                for notif in chunk
+            ]
+
+    def send_bulk_absence_notifications(
+        self,
+        notifications: List[dict],
+        teacher_name: str = "Your Teacher"
+    ) -> List[dict]:
+        """
+        Send multiple absence notifications via the Resend batch API.
+        One HTTPS call covers up to BATCH_SIZE recipients instead of one
+        round-trip per email; each recipient still gets their own
+        personalized body. Results keep request order.
+        """
+        to_send = [n for n in notifications if n.get("parent_email")]
+        results = []
+        for start in range(0, len(to_send), self.BATCH_SIZE):
+            chunk = to_send[start:start + self.BATCH_SIZE]
+            results.extend(self._send_batch_chunk(chunk, teacher_name))
         return results
+
+    async def send_bulk_absence_notifications_async(
+        self,
+        notifications: List[dict],
+        teacher_name: str = "Your Teacher"
+    ) -> List[dict]:
+        """
+        Async wrapper over the batch sender: chunks go out concurrently in
+        worker threads so the event loop never blocks on the Resend calls.
+        Results keep request order.
+        """
+        to_send = [n for n in notifications if n.get("parent_email")]
+        chunks = [
+            to_send[start:start + self.BATCH_SIZE]
+            for start in range(0, len(to_send), self.BATCH_SIZE)
+        ]
+        chunk_results = await asyncio.gather(
+            *[asyncio.to_thread(self._send_batch_chunk, chunk, teacher_name) for chunk in chunks]
+        )
+        return [result for chunk in chunk_results for result in chunk]
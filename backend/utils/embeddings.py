@@ -1,56 +1,166 @@
 import sys
+import logging
 import warnings
 import os
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
 
-# Import real face_recognition library
-try:
-    import face_recognition
-    print("✓ Using real face_recognition library")
-except ImportError as e:
-    print(f"✗ face_recognition library not available: {e}")
-    print("Please install: pip install face-recognition face_recognition_models setuptools")
-    raise
+# face_recognition pulls in dlib (~200MB RSS, >1s of BLAS/CUDA probing at
+# import), so it loads lazily on first use: constructing EmbeddingService —
+# or importing this module from a tool that never encodes — stays cheap.
+# The server still front-loads it via the startup warm-up in main.py.
+# cv2 stays a top-level import: __init__ needs it for the cached CLAHE and
+# it's a small fraction of dlib's cost.
+face_recognition = None
+
+def _load_face_recognition():
+    """Import the dlib-backed face_recognition library on first use"""
+    global face_recognition
+    if face_recognition is None:
+        try:
+            import face_recognition as fr
+            print("✓ Using real face_recognition library")
+        except ImportError as e:
+            print(f"✗ face_recognition library not available: {e}")
+            print("Please install: pip install face-recognition face_recognition_models setuptools")
+            raise
+        face_recognition = fr
+    return face_recognition
 
 import numpy as np
 import cv2
+
+from .numba_utils import l2_rows, argmin_dist
 from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import io
 from typing import Optional, List, Dict, Any
 import pickle
 
+# Per-image / per-frame chatter goes through a debug-gated logger: at 30 FPS
+# recognition plus parallel enrollment workers, unconditional prints are a
+# syscall+flush per message and serialize on stdout. Summaries and errors
+# still print like the rest of the codebase.
+logger = logging.getLogger(__name__)
+
 class EmbeddingService:
     def __init__(self):
         """Initialize the embedding service with improved settings"""
         self.embeddings_cache = {}
+        # Per-class .npz files: saving one class no longer rewrites every
+        # other class's arrays, and loading touches only the class asked for.
+        # The legacy single pickle is still read once at startup if present.
+        self.cache_dir = "embeddings_cache"
         self.cache_file = "embeddings_cache.pkl"
-        # Use CNN model for better accuracy (slower but more accurate than HOG)
-        self.face_detection_model = "cnn"  # Can be "hog" or "cnn"
-        # Number of times to upsample the image for better face detection
-        self.num_jitters = 3  # Reduced for faster training (was 10)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except Exception as e:
+            print(f"Could not create embeddings cache dir: {e}")
+        # HOG detection by default: on CPU the CNN detector costs seconds per
+        # frame vs tens of milliseconds for HOG, and enrollment photos are
+        # frontal and well-lit where HOG does fine. Switch back via
+        # POST /config/model for hard datasets. On a CUDA dlib build
+        # (pip install dlib --set DLIB_USE_CUDA=1 USE_AVX_INSTRUCTIONS=1)
+        # the default upgrades to CNN on first use — see _maybe_enable_cuda.
+        self.face_detection_model = "hog"  # Can be "hog" or "cnn"
+        self._cuda_checked = False
+        # Each jitter is a full ResNet forward pass per face; 1 keeps
+        # enrollment fast. Callers can pass num_jitters per call (or raise it
+        # via POST /config/jitters) for low-quality inputs.
+        self.num_jitters = 1
+        # cv2.createCLAHE builds tile LUT state; reuse one instance instead
+        # of reconstructing it on every preprocessed frame
+        self._clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        # photo-bytes hash -> encoding: re-enrolling a class re-encodes only
+        # students whose photo actually changed (hashing is ~free next to a
+        # dlib encode). Persisted alongside the per-class caches.
+        self._photo_hash_cache: Dict[str, np.ndarray] = {}
         self._load_cache()
+        self._load_photo_hash_cache()
     
     def _load_cache(self):
-        """Load embeddings cache from file"""
+        """Load the legacy pickle cache from file (migration path only)"""
         try:
             if os.path.exists(self.cache_file):
                 with open(self.cache_file, 'rb') as f:
                     self.embeddings_cache = pickle.load(f)
-                print(f"Loaded embeddings cache with {len(self.embeddings_cache)} classes")
+                print(f"Loaded legacy embeddings cache with {len(self.embeddings_cache)} classes")
         except Exception as e:
             print(f"Error loading embeddings cache: {e}")
             self.embeddings_cache = {}
-    
-    def _save_cache(self):
-        """Save embeddings cache to file"""
+
+    def _photo_hash_cache_path(self) -> str:
+        return os.path.join(self.cache_dir, "photo_hashes.npz")
+
+    def _load_photo_hash_cache(self):
+        """Load the photo-hash -> encoding table, if present"""
         try:
-            with open(self.cache_file, 'wb') as f:
-                pickle.dump(self.embeddings_cache, f)
-            print("Embeddings cache saved successfully")
+            path = self._photo_hash_cache_path()
+            if not os.path.exists(path):
+                return
+            with np.load(path, allow_pickle=False) as data:
+                self._photo_hash_cache = {
+                    str(digest): row for digest, row in zip(data['digests'], data['matrix'])
+                }
+            print(f"Loaded {len(self._photo_hash_cache)} cached photo encodings")
+        except Exception as e:
+            print(f"Error loading photo hash cache: {e}")
+            self._photo_hash_cache = {}
+
+    @staticmethod
+    def _atomic_savez(path: str, **arrays):
+        """
+        Write a compressed .npz atomically: a kill mid-write leaves the old
+        file intact instead of a truncated archive the next load chokes on.
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def _save_photo_hash_cache(self):
+        """Persist the photo-hash -> encoding table"""
+        try:
+            if not self._photo_hash_cache:
+                return
+            digests = list(self._photo_hash_cache.keys())
+            matrix = np.stack([np.asarray(self._photo_hash_cache[d]) for d in digests])
+            self._atomic_savez(self._photo_hash_cache_path(), digests=np.array(digests), matrix=matrix)
+        except Exception as e:
+            print(f"Error saving photo hash cache: {e}")
+
+    def _class_cache_path(self, class_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{class_id}.npz")
+
+    def _save_class_to_disk(self, class_id: str, embeddings: Dict[str, np.ndarray]):
+        """Persist one class as a compressed .npz of ids + stacked matrix"""
+        try:
+            student_ids = list(embeddings.keys())
+            matrix = np.ascontiguousarray(
+                np.stack([np.asarray(embeddings[sid]) for sid in student_ids]),
+                dtype=np.float32
+            )
+            self._atomic_savez(self._class_cache_path(class_id), ids=np.array(student_ids), matrix=matrix)
+            print(f"Embeddings cache saved for class {class_id}")
         except Exception as e:
-            print(f"Error saving embeddings cache: {e}")
+            print(f"Error saving embeddings cache for class {class_id}: {e}")
+
+    def _load_class_from_disk(self, class_id: str) -> Optional[Dict[str, np.ndarray]]:
+        """Load one class's embeddings from its .npz file, if present"""
+        try:
+            path = self._class_cache_path(class_id)
+            if not os.path.exists(path):
+                return None
+            with np.load(path, allow_pickle=False) as data:
+                student_ids = data['ids']
+                matrix = data['matrix']
+                # Rows are views into the one loaded matrix — no per-student copy
+                return {str(sid): row for sid, row in zip(student_ids, matrix)}
+        except Exception as e:
+            print(f"Error loading embeddings cache for class {class_id}: {e}")
+            return None
     
     def preprocess_image(self, image_data: bytes, enhance: bool = True) -> Optional[np.ndarray]:
         """
@@ -60,13 +170,20 @@ class EmbeddingService:
         try:
             # Convert bytes to PIL Image
             image = Image.open(io.BytesIO(image_data))
-            
+
+            # For JPEGs, let libjpeg downscale in the DCT domain during
+            # decode: a 12MP phone photo never materializes at full size
+            # just to be shrunk to the 1600px cap below. draft() is a no-op
+            # for formats that don't support it (PNG/WebP).
+            if image.format == 'JPEG':
+                image.draft('RGB', (1600, 1600))
+
             # Convert to RGB if needed
             if image.mode != 'RGB':
                 image = image.convert('RGB')
-            
-            # Convert to numpy array
-            image_array = np.array(image)
+
+            # Convert to numpy array (asarray: no copy for read-only use)
+            image_array = np.asarray(image)
             
             # Apply image enhancements for better face detection
             if enhance:
@@ -78,16 +195,22 @@ class EmbeddingService:
                     new_width = int(width * scale)
                     new_height = int(height * scale)
                     image_array = cv2.resize(image_array, (new_width, new_height), interpolation=cv2.INTER_AREA)
-                    print(f"Resized image from {width}x{height} to {new_width}x{new_height}")
+                    logger.debug("Resized image from %dx%d to %dx%d", width, height, new_width, new_height)
                 
-                # Improve contrast using CLAHE (Contrast Limited Adaptive Histogram Equalization)
-                lab = cv2.cvtColor(image_array, cv2.COLOR_RGB2LAB)
-                l, a, b = cv2.split(lab)
-                clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-                l = clahe.apply(l)
-                lab = cv2.merge([l, a, b])
-                image_array = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
-                print("Applied contrast enhancement")
+                # Improve contrast using CLAHE (Contrast Limited Adaptive Histogram Equalization).
+                # Skip it when the histogram is already well spread — most
+                # webcam frames are, and equalizing them is four full-image
+                # passes of pure memory traffic for no detection benefit.
+                # Also skip entirely for the CNN detector: it's trained on
+                # raw photographic intensities, and CLAHE amplifies noise in
+                # flat regions, which hurts rather than helps it.
+                if self.face_detection_model != "cnn" and image_array.std() < 40.0:
+                    # YCrCb instead of LAB: the luma plane is what CLAHE
+                    # needs and the RGB<->YCrCb converts are cheaper
+                    ycrcb = cv2.cvtColor(image_array, cv2.COLOR_RGB2YCrCb)
+                    ycrcb[:, :, 0] = self._clahe.apply(ycrcb[:, :, 0])
+                    image_array = cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2RGB)
+                    logger.debug("Applied contrast enhancement")
             
             return image_array
             
@@ -95,6 +218,65 @@ class EmbeddingService:
             print(f"Error preprocessing image: {e}")
             return None
     
+    def _is_degenerate_image(self, image_array: np.ndarray) -> bool:
+        """
+        Cheap pre-filter for frames that can't contain a detectable face
+        (tiny or near-uniform, e.g. a covered camera), so we skip the
+        expensive CNN detector entirely.
+        """
+        if image_array.size < 32 * 32 * 3:
+            logger.debug("Image too small for face detection — skipping")
+            return True
+        if image_array.std() < 5.0:
+            logger.debug("Image is near-uniform (blank frame?) — skipping face detection")
+            return True
+        return False
+
+    def _maybe_enable_cuda(self):
+        """
+        On the first detection, upgrade the default detector to CNN when
+        dlib was built with CUDA — there the CNN runs on GPU at a few ms
+        per frame and is strictly more accurate than HOG. Checked lazily so
+        importing dlib isn't forced at construction time; the startup
+        warm-up triggers this before any real request. An explicit
+        POST /config/model afterwards still wins.
+        """
+        if self._cuda_checked:
+            return
+        self._cuda_checked = True
+        try:
+            import dlib
+            if getattr(dlib, 'DLIB_USE_CUDA', False):
+                self.face_detection_model = "cnn"
+                print("✓ dlib CUDA build detected — using CNN detector on GPU")
+        except Exception as e:
+            print(f"Could not check dlib CUDA support: {e}")
+
+    def _detect_face_locations(self, image_array: np.ndarray) -> List[tuple]:
+        """
+        Coarse-to-fine detection: run the detector on a half-size frame when
+        the image is large (detector cost is O(pixels), so this is ~4x
+        cheaper) and scale the boxes back up. The encoder still sees the
+        full-resolution crops, so accuracy is unaffected.
+        """
+        fr = _load_face_recognition()
+        self._maybe_enable_cuda()
+        height, width = image_array.shape[:2]
+        if max(height, width) <= 800:
+            return fr.face_locations(image_array, model=self.face_detection_model)
+
+        small = cv2.resize(image_array, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+        locations = fr.face_locations(small, model=self.face_detection_model)
+        return [
+            (
+                max(0, top * 2),
+                min(width, right * 2),
+                min(height, bottom * 2),
+                max(0, left * 2)
+            )
+            for top, right, bottom, left in locations
+        ]
+
     def extract_face_encoding(self, image_data: bytes, num_jitters: Optional[int] = None) -> Optional[np.ndarray]:
         """
         Extract face encoding from image data with improved accuracy
@@ -108,36 +290,36 @@ class EmbeddingService:
             image_array = self.preprocess_image(image_data, enhance=True)
             if image_array is None:
                 return None
-            
-            # Find face locations using the configured model
-            face_locations = face_recognition.face_locations(
-                image_array, 
-                model=self.face_detection_model
-            )
-            
+
+            if self._is_degenerate_image(image_array):
+                return None
+
+            # Find face locations (downscale-first when the frame is large)
+            face_locations = self._detect_face_locations(image_array)
+
             if not face_locations:
-                print("No faces found in image")
+                logger.debug("No faces found in image")
                 return None
             
             if len(face_locations) > 1:
-                print(f"Multiple faces found ({len(face_locations)}), using the largest one")
+                logger.debug("Multiple faces found (%d), using the largest one", len(face_locations))
                 # Select the largest face (most prominent in the image)
                 face_locations = [max(face_locations, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))]
             
             # Extract face encodings with jittering for better accuracy
             # num_jitters: How many times to re-sample the face when calculating encoding
             # Higher is more accurate, but slower
-            face_encodings = face_recognition.face_encodings(
+            face_encodings = _load_face_recognition().face_encodings(
                 image_array, 
                 face_locations,
                 num_jitters=num_jitters
             )
             
             if not face_encodings:
-                print("Could not generate face encoding")
+                logger.debug("Could not generate face encoding")
                 return None
             
-            print(f"Successfully extracted face encoding with {num_jitters} jitters")
+            logger.debug("Successfully extracted face encoding with %d jitters", num_jitters)
             # Return the first face encoding
             return face_encodings[0]
             
@@ -159,18 +341,18 @@ class EmbeddingService:
             if image_array is None:
                 return []
 
-            face_locations = face_recognition.face_locations(
-                image_array,
-                model=self.face_detection_model
-            )
+            if self._is_degenerate_image(image_array):
+                return []
+
+            face_locations = self._detect_face_locations(image_array)
 
             if not face_locations:
-                print("No faces found in image")
+                logger.debug("No faces found in image")
                 return []
 
-            print(f"Detected {len(face_locations)} face(s) in batch image")
+            logger.debug("Detected %d face(s) in batch image", len(face_locations))
 
-            face_encodings = face_recognition.face_encodings(
+            face_encodings = _load_face_recognition().face_encodings(
                 image_array,
                 face_locations,
                 num_jitters=num_jitters
@@ -189,28 +371,104 @@ class EmbeddingService:
             print(f"Error extracting all face encodings: {e}")
             return []
 
+    def _distance_matrix(self, known_encodings, unknown_encoding: np.ndarray) -> np.ndarray:
+        """
+        Compute L2 distances between one probe encoding and the whole gallery
+        in a single vectorized pass (no per-encoding Python calls).
+        Accepts a list of encodings or a pre-stacked (N, 128) ndarray.
+        NaN/inf distances are clamped to 1.0 (worst match).
+        """
+        if isinstance(known_encodings, np.ndarray):
+            known = np.ascontiguousarray(known_encodings, dtype=np.float32)
+        else:
+            known = np.ascontiguousarray(np.stack(known_encodings)).astype(np.float32, copy=False)
+        probe = np.asarray(unknown_encoding, dtype=np.float32)
+        if l2_rows is not None:
+            # Fused JIT kernel: no (N, 128) difference temporary
+            distances = l2_rows(known, probe)
+        else:
+            diff = known - probe
+            distances = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        return np.nan_to_num(distances, nan=1.0, posinf=1.0, neginf=1.0)
+
     def compare_faces(self, known_encodings: List[np.ndarray], unknown_encoding: np.ndarray, tolerance: float = 0.6) -> List[bool]:
         """
         Compare unknown face encoding with known encodings
         Returns list of boolean matches
         """
         try:
-            return face_recognition.compare_faces(known_encodings, unknown_encoding, tolerance=tolerance)
+            if len(known_encodings) == 0:
+                return []
+            distances = self._distance_matrix(known_encodings, unknown_encoding)
+            return (distances < tolerance).tolist()
         except Exception as e:
             print(f"Error comparing faces: {e}")
             return []
-    
+
     def face_distance(self, known_encodings: List[np.ndarray], unknown_encoding: np.ndarray) -> List[float]:
         """
         Calculate face distances (lower is better match)
         Returns list of distances
         """
         try:
-            return face_recognition.face_distance(known_encodings, unknown_encoding)
+            if len(known_encodings) == 0:
+                return []
+            return self._distance_matrix(known_encodings, unknown_encoding).tolist()
         except Exception as e:
             print(f"Error calculating face distances: {e}")
             return []
     
+    def match_gallery(self, student_ids: List[str], gallery_matrix: np.ndarray, unknown_encoding: np.ndarray, tolerance: float = 0.6, gallery_sq_norms: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Find the best match against a pre-stacked (N, 128) gallery matrix.
+        Same result contract as find_best_match, but skips the per-call
+        dict -> list -> stack work for callers that keep a cached matrix.
+        When the caller also caches the squared row norms, the exact L2
+        distances come from a single matrix-vector product via
+        |g-p|^2 = |g|^2 - 2*g.p + |p|^2 instead of materializing the
+        (N, 128) difference matrix.
+        """
+        try:
+            if gallery_matrix is None or not student_ids:
+                return {"matched": False, "student_id": None, "confidence": 0.0}
+
+            if gallery_sq_norms is not None:
+                probe = np.asarray(unknown_encoding, dtype=np.float32)
+                sq_dists = gallery_sq_norms - 2.0 * (gallery_matrix @ probe) + probe @ probe
+                distances = np.sqrt(np.maximum(sq_dists, 0.0))
+                distances = np.nan_to_num(distances, nan=1.0, posinf=1.0, neginf=1.0)
+            else:
+                distances = self._distance_matrix(gallery_matrix, unknown_encoding)
+
+            best_index = int(np.argmin(distances))
+            best_distance = float(distances[best_index])
+            best_student_id = student_ids[best_index]
+
+            confidence = max(0.0, 1.0 - best_distance)
+            is_match = best_distance <= tolerance
+
+            logger.debug("Best match: %s, distance: %.3f, confidence: %.3f, threshold: %s", best_student_id, best_distance, confidence, tolerance)
+
+            if is_match:
+                return {
+                    "matched": True,
+                    "student_id": best_student_id,
+                    "confidence": float(confidence),
+                    "distance": float(best_distance)
+                }
+            else:
+                return {
+                    "matched": False,
+                    "student_id": best_student_id,
+                    "confidence": float(confidence),
+                    "distance": float(best_distance),
+                    "reason": "Distance exceeds tolerance"
+                }
+
+        except Exception as e:
+            print(f"Error matching against gallery: {e}")
+            return {"matched": False, "student_id": None, "confidence": 0.0}
+
     def find_best_match(self, known_encodings: Dict[str, np.ndarray], unknown_encoding: np.ndarray, tolerance: float = 0.6) -> Dict[str, Any]:
         """
         Find the best match for an unknown face encoding with improved matching logic
@@ -223,16 +481,22 @@ class EmbeddingService:
             # Prepare data
             student_ids = list(known_encodings.keys())
             encodings = list(known_encodings.values())
-            
-            # Calculate distances (lower is better)
-            distances = self.face_distance(encodings, unknown_encoding)
-            
-            # Clean up distances - remove inf and NaN values
-            distances = [float(d) if not (np.isnan(d) or np.isinf(d)) else 1.0 for d in distances]
-            
-            # Find the best match (lowest distance)
-            best_index = np.argmin(distances)
-            best_distance = distances[best_index]
+
+            best_index = -1
+            if argmin_dist is not None:
+                # Fused JIT kernel: distance + argmin in one pass, no
+                # N-length distance vector materialized
+                known = np.ascontiguousarray(np.stack(encodings), dtype=np.float32)
+                probe = np.asarray(unknown_encoding, dtype=np.float32)
+                best_index, best_distance = argmin_dist(known, probe)
+
+            if best_index < 0:
+                # NumPy fallback (or all-NaN degenerate input); NaN/inf are
+                # clamped to 1.0 inside the vectorized distance pass
+                distances = self._distance_matrix(encodings, unknown_encoding)
+                best_index = int(np.argmin(distances))
+                best_distance = float(distances[best_index])
+
             best_student_id = student_ids[best_index]
             
             # Convert distance to confidence (0-1 scale, higher is better)
@@ -242,10 +506,10 @@ class EmbeddingService:
             # Check if distance is within tolerance
             is_match = best_distance <= tolerance
             
-            print(f"Best match: {best_student_id}, distance: {best_distance:.3f}, confidence: {confidence:.3f}, threshold: {tolerance}")
+            logger.debug("Best match: %s, distance: %.3f, confidence: %.3f, threshold: %s", best_student_id, best_distance, confidence, tolerance)
             
             if is_match:
-                print(f"Match accepted: {best_student_id} with confidence {confidence:.3f}")
+                logger.debug("Match accepted: %s with confidence %.3f", best_student_id, confidence)
                 return {
                     "matched": True,
                     "student_id": best_student_id,
@@ -253,7 +517,7 @@ class EmbeddingService:
                     "distance": float(best_distance)
                 }
             else:
-                print(f"No match: best distance {best_distance:.3f} exceeds tolerance {tolerance}")
+                logger.debug("No match: best distance %.3f exceeds tolerance %s", best_distance, tolerance)
                 return {
                     "matched": False,
                     "student_id": best_student_id,
@@ -266,52 +530,95 @@ class EmbeddingService:
             print(f"Error finding best match: {e}")
             return {"matched": False, "student_id": None, "confidence": 0.0}
     
+    def generate_student_embedding(self, student: Dict[str, Any], image_data) -> Optional[np.ndarray]:
+        """
+        Generate a face embedding for one student from pre-downloaded image data
+        Returns the encoding or None if the photo is missing/unusable
+        """
+        try:
+            student_id = student['id']
+            student_name = student['name']
+            photo_path = student.get('photo', '')
+
+            if not photo_path:
+                print(f"No photo found for student {student_name} ({student_id})")
+                return None
+
+            logger.debug("Processing student: %s (%s)", student_name, student_id)
+
+            if image_data is None:
+                print(f"Could not download image for student {student_name}")
+                return None
+
+            # Handle base64 data URLs
+            if isinstance(image_data, str) and image_data.startswith('data:image'):
+                try:
+                    import base64
+                    header, encoded = image_data.split(',', 1)
+                    image_data = base64.b64decode(encoded)
+                except Exception as e:
+                    print(f"Error decoding base64 image for {student_name}: {e}")
+                    return None
+
+            # Unchanged photo bytes -> reuse the cached encoding and skip dlib
+            digest = None
+            if isinstance(image_data, bytes):
+                digest = hashlib.blake2b(image_data, digest_size=16).hexdigest()
+                cached = self._photo_hash_cache.get(digest)
+                if cached is not None:
+                    logger.debug("Photo unchanged for %s — reusing cached encoding", student_name)
+                    return cached
+
+            # Extract face encoding
+            encoding = self.extract_face_encoding(image_data)
+
+            if encoding is not None:
+                if digest is not None:
+                    self._photo_hash_cache[digest] = encoding
+                logger.debug("Successfully generated embedding for %s", student_name)
+            else:
+                print(f"Could not generate face encoding for {student_name}")
+            return encoding
+
+        except Exception as e:
+            print(f"Error processing student {student.get('name', 'Unknown')}: {e}")
+            return None
+
+    def batch_extract_face_encodings(self, images: List[bytes], num_jitters: Optional[int] = None) -> List[Optional[np.ndarray]]:
+        """
+        Extract face encodings for a batch of images in parallel worker
+        threads (dlib releases the GIL during detection/encoding).
+        Returns one encoding (or None) per input image, in order.
+        Note: dlib's batch_face_locations only pays off on its CUDA build
+        and needs uniform frame sizes, so a thread pool over face_locations
+        is the right CPU path here.
+        """
+        if not images:
+            return []
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+            return list(executor.map(
+                lambda data: self.extract_face_encoding(data, num_jitters=num_jitters),
+                images
+            ))
+
     def generate_class_embeddings_sync(self, students_with_images: List[tuple]) -> Dict[str, np.ndarray]:
         """
         Generate face embeddings for students with their pre-downloaded image data
         Returns dict mapping student_id to face encoding
         """
         embeddings = {}
-        
-        for student, image_data in students_with_images:
-            try:
-                student_id = student['id']
-                student_name = student['name']
-                photo_path = student.get('photo', '')
-                
-                if not photo_path:
-                    print(f"No photo found for student {student_name} ({student_id})")
-                    continue
-                
-                print(f"Processing student: {student_name} ({student_id})")
-                
-                if image_data is None:
-                    print(f"Could not download image for student {student_name}")
-                    continue
-                
-                # Handle base64 data URLs
-                if isinstance(image_data, str) and image_data.startswith('data:image'):
-                    try:
-                        import base64
-                        header, encoded = image_data.split(',', 1)
-                        image_data = base64.b64decode(encoded)
-                    except Exception as e:
-                        print(f"Error decoding base64 image for {student_name}: {e}")
-                        continue
-                
-                # Extract face encoding
-                encoding = self.extract_face_encoding(image_data)
-                
-                if encoding is not None:
-                    embeddings[student_id] = encoding
-                    print(f"Successfully generated embedding for {student_name}")
-                else:
-                    print(f"Could not generate face encoding for {student_name}")
-                
-            except Exception as e:
-                print(f"Error processing student {student.get('name', 'Unknown')}: {e}")
-                continue
-        
+
+        # Encode the whole class in parallel worker threads
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+            encodings = list(executor.map(
+                lambda pair: self.generate_student_embedding(pair[0], pair[1]),
+                students_with_images
+            ))
+
+        for (student, _), encoding in zip(students_with_images, encodings):
+            if encoding is not None:
+                embeddings[student['id']] = encoding
+
         print(f"Generated embeddings for {len(embeddings)} out of {len(students_with_images)} students")
         return embeddings
 
@@ -332,7 +639,7 @@ class EmbeddingService:
                     print(f"No photo found for student {student_name} ({student_id})")
                     continue
                 
-                print(f"Processing student: {student_name} ({student_id})")
+                logger.debug("Processing student: %s (%s)", student_name, student_id)
                 
                 # Download image
                 image_data = None
@@ -358,7 +665,7 @@ class EmbeddingService:
                 
                 if encoding is not None:
                     embeddings[student_id] = encoding
-                    print(f"Successfully generated embedding for {student_name}")
+                    logger.debug("Successfully generated embedding for %s", student_name)
                 else:
                     print(f"Could not generate face encoding for {student_name}")
                 
@@ -370,10 +677,20 @@ class EmbeddingService:
         return embeddings
     
     def save_class_embeddings(self, class_id: str, embeddings: Dict[str, np.ndarray]):
-        """Save embeddings for a class to cache"""
+        """Save embeddings for a class to cache (memory + per-class .npz)"""
         self.embeddings_cache[class_id] = embeddings
-        self._save_cache()
-    
+        self._save_class_to_disk(class_id, embeddings)
+        # Persist any encodings hashed during this training run too
+        self._save_photo_hash_cache()
+
     def load_class_embeddings(self, class_id: str) -> Dict[str, np.ndarray]:
-        """Load embeddings for a class from cache"""
-        return self.embeddings_cache.get(class_id, {})
\ No newline at end of file
+        """Load embeddings for a class from cache (memory, then disk)"""
+        embeddings = self.embeddings_cache.get(class_id)
+        if embeddings:
+            return embeddings
+
+        embeddings = self._load_class_from_disk(class_id)
+        if embeddings is not None:
+            self.embeddings_cache[class_id] = embeddings
+            return embeddings
+        return {}
\ No newline at end of file
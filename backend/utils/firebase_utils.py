@@ -1,17 +1,26 @@
 import firebase_admin
 from firebase_admin import credentials, firestore, storage
 import asyncio
-import requests
+import httpx
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import os
 import json
+import time
 
 class FirebaseService:
     def __init__(self):
         """Initialize Firebase Admin SDK"""
         self.db = None
         self.bucket = None
+        # Shared async HTTP client for photo downloads (created lazily so it
+        # binds to the running event loop); keep-alive pool means training a
+        # class pays TLS setup once, not once per student
+        self._http_client: Optional[httpx.AsyncClient] = None
+        # photo_path -> (signed URL, expiry epoch): signing is an HMAC plus
+        # metadata lookups, and the URLs live for an hour — no need to redo
+        # it per student per rebuild
+        self._url_cache: Dict[str, tuple] = {}
         self._initialize_firebase()
     
     def _initialize_firebase(self):
@@ -100,23 +109,39 @@ class FirebaseService:
             # If photo_path is already a URL, return it
             if photo_path.startswith('http'):
                 return photo_path
-            
-            # If it's a Firebase Storage path, get download URL
+
+            # Reuse a previously signed URL while it has >60s of life left
+            cached = self._url_cache.get(photo_path)
+            if cached is not None and cached[1] > time.time() + 60:
+                return cached[0]
+
+            # If it's a Firebase Storage path, get download URL.
+            # No blob.exists() pre-check — that's an extra Storage round trip
+            # per student, and a missing blob just fails at download time.
             if photo_path.startswith('gs://') or '/' in photo_path:
                 blob = self.bucket.blob(photo_path)
-                if blob.exists():
-                    return blob.generate_signed_url(expiration=3600)  # 1 hour expiry
-            
+                url = blob.generate_signed_url(expiration=3600)  # 1 hour expiry
+                self._url_cache[photo_path] = (url, time.time() + 3600)
+                return url
+
             return None
             
         except Exception as e:
             print(f"Error getting photo URL for {photo_path}: {e}")
             return None
     
+    def _get_http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                timeout=10.0,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            )
+        return self._http_client
+
     async def download_image(self, url: str) -> Optional[bytes]:
-        """Download image from URL"""
+        """Download image from URL (non-blocking; downloads overlap when gathered)"""
         try:
-            response = requests.get(url, timeout=10)
+            response = await self._get_http_client().get(url)
             response.raise_for_status()
             return response.content
         except Exception as e:
@@ -176,85 +201,27 @@ class FirebaseService:
             return {}
     
     async def mark_student_attendance(self, class_id: str, student_id: str) -> Dict[str, Any]:
-        """Mark attendance for a student"""
-        try:
-            if self.db is None:
-                raise Exception("Firebase not initialized")
-            
-            # Get student info
-            students = await self.get_class_students(class_id)
-            student = next((s for s in students if s['id'] == student_id), None)
-            
-            if not student:
-                raise Exception(f"Student {student_id} not found in class {class_id}")
-            
-            # Get today's date
-            today = datetime.now().strftime('%Y-%m-%d')
-            
-            # Get class document
-            class_ref = self.db.collection('classes').document(class_id)
-            class_doc = class_ref.get()
-            
-            if not class_doc.exists:
-                raise Exception(f"Class {class_id} not found")
-            
-            class_data = class_doc.to_dict()
-            attendance_records = class_data.get('attendanceRecords', [])
-            
-            # Find today's attendance record
-            today_record = None
-            record_index = -1
-            
-            for i, record in enumerate(attendance_records):
-                if record.get('date') == today:
-                    today_record = record
-                    record_index = i
-                    break
-            
-            # Create or update today's record
-            if today_record is None:
-                # Create new record for today
-                all_student_ids = [s['id'] for s in students]
-                today_record = {
-                    'id': f"{class_id}_{today}",
-                    'classId': class_id,
-                    'date': today,
-                    'presentStudents': [student_id],
-                    'absentStudents': [sid for sid in all_student_ids if sid != student_id]
-                }
-                attendance_records.append(today_record)
-            else:
-                # Update existing record
-                present_students = today_record.get('presentStudents', [])
-                absent_students = today_record.get('absentStudents', [])
-                
-                # Add to present if not already there
-                if student_id not in present_students:
-                    present_students.append(student_id)
-                
-                # Remove from absent if there
-                if student_id in absent_students:
-                    absent_students.remove(student_id)
-                
-                today_record['presentStudents'] = present_students
-                today_record['absentStudents'] = absent_students
-                attendance_records[record_index] = today_record
-            
-            # Update the class document
-            class_ref.update({'attendanceRecords': attendance_records})
-            
-            print(f"Marked attendance for student {student['name']} ({student_id}) in class {class_id}")
-            
-            return {
-                'studentName': student['name'],
-                'date': today,
-                'status': 'present'
-            }
-            
-        except Exception as e:
-            print(f"Error marking attendance: {e}")
-            raise
-    
+        """
+        Mark attendance for a single student.
+        Thin wrapper over the transactional batch write — the old
+        read-modify-write here could lose updates when two devices marked
+        concurrently, and duplicating the record-merging logic in two
+        places invited drift.
+        """
+        result = await self.mark_multiple_students_attendance(class_id, [student_id])
+
+        student_name = result.get('markedStudentsById', {}).get(student_id)
+        if student_name is None:
+            raise Exception(f"Student {student_id} not found in class {class_id}")
+
+        print(f"Marked attendance for student {student_name} ({student_id}) in class {class_id}")
+
+        return {
+            'studentName': student_name,
+            'date': result['date'],
+            'status': 'present'
+        }
+
     async def mark_multiple_students_attendance(self, class_id: str, student_ids: List[str]) -> Dict[str, Any]:
         """
         Atomically mark multiple students present in a single Firestore write.
@@ -276,7 +243,7 @@ class FirebaseService:
             valid_student_ids = [sid for sid in student_ids if sid in all_student_ids]
 
             if not valid_student_ids:
-                return {'markedCount': 0, 'markedStudents': [], 'date': datetime.now().strftime('%Y-%m-%d')}
+                return {'markedCount': 0, 'markedStudents': [], 'markedStudentsById': {}, 'date': datetime.now().strftime('%Y-%m-%d')}
 
             today = datetime.now().strftime('%Y-%m-%d')
             class_ref = self.db.collection('classes').document(class_id)
@@ -333,6 +300,7 @@ class FirebaseService:
             return {
                 'markedCount': len(valid_student_ids),
                 'markedStudents': marked_names,
+                'markedStudentsById': {sid: student_name_map.get(sid, sid) for sid in valid_student_ids},
                 'date': today
             }
 
@@ -0,0 +1,69 @@
+"""
+Optional Numba-accelerated distance kernel for face matching.
+
+The NumPy path materializes an (N, 128) difference temporary per probe;
+the JIT kernel fuses subtract, square and reduction in one pass over the
+gallery with LLVM auto-vectorization and parallel rows. Numba is an
+optional dependency — callers must handle l2_rows being None.
+"""
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+    print("✓ numba available for JIT distance kernel")
+except ImportError:
+    NUMBA_AVAILABLE = False
+    print("⚠ numba not available, using NumPy distance path")
+
+l2_rows = None
+argmin_dist = None
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True, parallel=True)
+    def _l2_rows(gallery, probe, out):
+        for i in prange(gallery.shape[0]):
+            acc = 0.0
+            for k in range(gallery.shape[1]):
+                d = gallery[i, k] - probe[k]
+                acc += d * d
+            out[i] = np.sqrt(acc)
+
+    @njit(cache=True, fastmath=True)
+    def _argmin_dist(gallery, probe):
+        # Fused distance + argmin: no N-length distance vector at all.
+        # Serial on purpose — a parallel argmin reduction costs more in
+        # synchronization than it saves at gallery sizes seen here.
+        best_idx = -1
+        best_sq = np.inf
+        for i in range(gallery.shape[0]):
+            acc = 0.0
+            for k in range(gallery.shape[1]):
+                d = gallery[i, k] - probe[k]
+                acc += d * d
+            if acc < best_sq:
+                best_sq = acc
+                best_idx = i
+        return best_idx, np.sqrt(best_sq)
+
+    def l2_rows(gallery: np.ndarray, probe: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """Row-wise L2 distances between a (N, D) gallery and a (D,) probe"""
+        if out is None:
+            out = np.empty(gallery.shape[0], dtype=np.float32)
+        _l2_rows(gallery, probe, out)
+        return out
+
+    def argmin_dist(gallery: np.ndarray, probe: np.ndarray) -> tuple:
+        """Best (index, L2 distance) of a (D,) probe against a (N, D) gallery"""
+        best_idx, best_dist = _argmin_dist(gallery, probe)
+        return int(best_idx), float(best_dist)
+
+    # Warm-compile at import time so the first request doesn't pay JIT latency
+    try:
+        l2_rows(np.zeros((1, 128), dtype=np.float32), np.zeros(128, dtype=np.float32))
+        argmin_dist(np.zeros((1, 128), dtype=np.float32), np.zeros(128, dtype=np.float32))
+    except Exception as e:
+        print(f"⚠ numba warm-up failed, using NumPy distance path: {e}")
+        l2_rows = None
+        argmin_dist = None
+        NUMBA_AVAILABLE = False
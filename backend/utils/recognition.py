@@ -1,9 +1,18 @@
 import asyncio
+import json
+import logging
+import os
 from typing import Dict, Any, List, Optional
 import numpy as np
 from .firebase_utils import FirebaseService
 from .embeddings import EmbeddingService
 
+# Per-request / per-face chatter goes through a debug-gated logger so that
+# production (INFO) deployments skip the formatting and stdout flush on the
+# recognize hot path. Summaries and errors still print like the rest of the
+# codebase.
+logger = logging.getLogger(__name__)
+
 class RecognitionService:
     def __init__(self, firebase_service: FirebaseService, embedding_service: EmbeddingService):
         """Initialize recognition service with Firebase and embedding services"""
@@ -13,7 +22,138 @@ class RecognitionService:
         # 0.6 is the recommended default for face_recognition library
         # 0.5 = strict (may miss some matches), 0.6 = balanced, 0.7 = lenient (more false positives)
         self.recognition_threshold = 0.6  # Library default — 0.55 was rejecting valid matches
-    
+        # Per-class gallery cache: class_id -> (student_ids, contiguous float32 (N, 128) matrix)
+        # Stacking the per-student encodings on every request dominates for large
+        # classes, so build the matrix once and invalidate only on retraining.
+        self._gallery_cache: Dict[str, tuple] = {}
+        # Galleries are also persisted as {class_id}.npy + {class_id}.ids.json
+        # so a cold start is one mmap load instead of Firestore round-trips
+        self.gallery_cache_dir = "gallery_cache"
+        try:
+            os.makedirs(self.gallery_cache_dir, exist_ok=True)
+        except Exception as e:
+            print(f"Could not create gallery cache dir: {e}")
+        # Single cap on concurrent dlib encodes (training and recognition
+        # share it) — excess requests queue here instead of oversubscribing
+        # cores, and the event loop stays free while the CNN runs.
+        self._encode_semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+
+    def invalidate_cache(self, class_id: str):
+        """
+        Drop the cached gallery for a class so the next request rebuilds
+        it from Firestore — for when embeddings change outside
+        train_class_embeddings (which rebuilds the gallery itself).
+        Removes the persisted .npy/ids.json too; _get_gallery checks disk
+        before Firestore, so leaving them would resurrect the stale
+        gallery on the very next request.
+        """
+        self._gallery_cache.pop(class_id, None)
+        matrix_path, ids_path = self._gallery_paths(class_id)
+        for path in (matrix_path, ids_path):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except Exception as e:
+                print(f"Could not remove stale gallery file {path}: {e}")
+
+    def _gallery_paths(self, class_id: str) -> tuple:
+        matrix_path = os.path.join(self.gallery_cache_dir, f"{class_id}.npy")
+        ids_path = os.path.join(self.gallery_cache_dir, f"{class_id}.ids.json")
+        return matrix_path, ids_path
+
+    def _save_gallery_to_disk(self, class_id: str, student_ids: List[str], matrix: np.ndarray):
+        """
+        Persist the stacked gallery so cold start skips Firestore.
+        Writes go to a temp file and os.replace into place: loaded
+        galleries are memory-mapped and may be serving in-flight
+        /recognize calls, so the old .npy inode must stay intact until
+        the swap — an in-place rewrite would tear reads (or SIGBUS on
+        truncate) under a concurrent /train.
+        """
+        try:
+            matrix_path, ids_path = self._gallery_paths(class_id)
+            tmp_matrix = matrix_path + ".tmp"
+            with open(tmp_matrix, 'wb') as f:
+                np.save(f, matrix)
+            os.replace(tmp_matrix, matrix_path)
+            tmp_ids = ids_path + ".tmp"
+            with open(tmp_ids, 'w') as f:
+                json.dump(student_ids, f)
+            os.replace(tmp_ids, ids_path)
+        except Exception as e:
+            print(f"Error persisting gallery for class {class_id}: {e}")
+
+    def _load_gallery_from_disk(self, class_id: str) -> Optional[tuple]:
+        """Load a persisted gallery (memory-mapped) if one exists"""
+        try:
+            matrix_path, ids_path = self._gallery_paths(class_id)
+            if not (os.path.exists(matrix_path) and os.path.exists(ids_path)):
+                return None
+            matrix = np.load(matrix_path, mmap_mode='r')
+            with open(ids_path) as f:
+                student_ids = json.load(f)
+            if len(student_ids) != matrix.shape[0]:
+                print(f"Gallery files for class {class_id} are inconsistent — ignoring")
+                return None
+            sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+            print(f"Loaded gallery for class {class_id} from disk ({matrix.shape[0]} students)")
+            return student_ids, matrix, sq_norms
+        except Exception as e:
+            print(f"Error loading persisted gallery for class {class_id}: {e}")
+            return None
+
+    def _build_gallery(self, class_id: str, embeddings: Dict[str, np.ndarray]) -> tuple:
+        """Stack per-student encodings into a cached (ids, float32 matrix, squared row norms) triple"""
+        student_ids = list(embeddings.keys())
+        matrix = np.ascontiguousarray(
+            np.vstack([np.asarray(embeddings[sid]) for sid in student_ids]),
+            dtype=np.float32
+        )
+        # Precomputed |g|^2 per row lets the matcher get exact L2 distances
+        # from a single matrix-vector product (|g-p|^2 = |g|^2 - 2*g.p + |p|^2)
+        sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+        gallery = (student_ids, matrix, sq_norms)
+        self._gallery_cache[class_id] = gallery
+        self._save_gallery_to_disk(class_id, student_ids, matrix)
+        return gallery
+
+    async def _get_gallery(self, class_id: str) -> tuple:
+        """
+        Get the cached (student_ids, matrix, squared row norms) gallery for a
+        class, building it from the stored embeddings on first use.
+        Returns ([], None, None) if the class has no trained embeddings.
+        """
+        gallery = self._gallery_cache.get(class_id)
+        if gallery is not None:
+            return gallery
+
+        # Cold start: a persisted gallery is one mmap load, no Firestore
+        gallery = self._load_gallery_from_disk(class_id)
+        if gallery is not None:
+            self._gallery_cache[class_id] = gallery
+            return gallery
+
+        embeddings = await self.load_class_embeddings(class_id)
+        if not embeddings:
+            return [], None, None
+
+        return self._build_gallery(class_id, embeddings)
+
+    async def _resolve_and_download(self, photo_path: str) -> Optional[bytes]:
+        """
+        Resolve a student's photo reference to image bytes. Direct URLs
+        download straight away; storage paths go through the (cached)
+        signed-URL lookup first. Returns None for missing photos.
+        """
+        if not photo_path:
+            return None
+        if photo_path.startswith('http'):
+            return await self.firebase.download_image(photo_path)
+        url = await self.firebase.get_student_photo_url(photo_path)
+        if url:
+            return await self.firebase.download_image(url)
+        return None
+
     async def train_class_embeddings(self, class_id: str, students: List[Dict[str, Any]]) -> int:
         """
         Train face recognition model for a class
@@ -23,46 +163,46 @@ class RecognitionService:
         try:
             print(f"Training embeddings for class {class_id} with {len(students)} students")
             
-            # Create downloads for all students
-            download_tasks = []
-            for student in students:
-                photo_path = student.get('photo', '')
-                if photo_path:
-                    if photo_path.startswith('http'):
-                        download_tasks.append(self.firebase.download_image(photo_path))
-                    else:
-                        # Get download URL from Firebase Storage then download
-                        async def get_and_download(path):
-                            url = await self.firebase.get_student_photo_url(path)
-                            if url:
-                                return await self.firebase.download_image(url)
-                            return None
-                        download_tasks.append(get_and_download(photo_path))
-                else:
-                    # Create a coroutine that returns None
-                    async def return_none():
-                        return None
-                    download_tasks.append(return_none())
-            
-            # Download all images concurrently
-            image_data_list = await asyncio.gather(*download_tasks, return_exceptions=True)
-            
-            # Create a mapping of students to their image data
-            students_with_images = []
-            for i, student in enumerate(students):
-                image_data = image_data_list[i] if i < len(image_data_list) and not isinstance(image_data_list[i], Exception) else None
-                students_with_images.append((student, image_data))
-            
-            # Generate embeddings synchronously
-            embeddings = self.embeddings.generate_class_embeddings_sync(students_with_images)
+            # Download all photos concurrently through the shared helper —
+            # no per-student closure definitions inside the loop
+            download_tasks = [
+                self._resolve_and_download(student.get('photo', ''))
+                for student in students
+            ]
+
+            # Download all images concurrently. _resolve_and_download never
+            # raises (failures are logged and come back as None), so gather
+            # results map 1:1 to students with no exception-sentinel scan.
+            image_data_list = await asyncio.gather(*download_tasks)
+            students_with_images = list(zip(students, image_data_list))
+
+
+            # Encode students in parallel worker threads, bounded by the
+            # shared encode semaphore so a big class doesn't oversubscribe
+            # cores or starve concurrent /recognize requests.
+            async def encode_student(student, image_data):
+                async with self._encode_semaphore:
+                    encoding = await asyncio.to_thread(
+                        self.embeddings.generate_student_embedding, student, image_data
+                    )
+                return student['id'], encoding
+
+            encode_results = await asyncio.gather(
+                *[encode_student(student, image_data) for student, image_data in students_with_images]
+            )
+            embeddings = {sid: enc for sid, enc in encode_results if enc is not None}
+            print(f"Generated embeddings for {len(embeddings)} out of {len(students)} students")
             
             if embeddings:
                 # Save to local cache
                 self.embeddings.save_class_embeddings(class_id, embeddings)
-                
+
                 # Save to Firebase
                 await self.firebase.save_embeddings(class_id, embeddings)
-                
+
+                # Rebuild the stacked gallery matrix for this class
+                self._build_gallery(class_id, embeddings)
+
                 print(f"Successfully trained embeddings for {len(embeddings)} students")
                 return len(embeddings)
             else:
@@ -117,21 +257,32 @@ class RecognitionService:
         Returns recognition result with match info
         """
         try:
-            print(f"Starting face recognition for class {class_id}")
-            
-            # Load class embeddings
-            known_embeddings = await self.load_class_embeddings(class_id)
-            
-            if not known_embeddings:
+            logger.debug("Starting face recognition for class %s", class_id)
+
+            # A real webcam frame is never this small — skip all work
+            if not image_data or len(image_data) < 1024:
+                return {
+                    "matched": False,
+                    "error": "Image data too small to contain a face"
+                }
+
+            # Load the cached class gallery
+            gallery_ids, gallery_matrix, gallery_sq_norms = await self._get_gallery(class_id)
+
+            if not gallery_ids:
                 return {
                     "matched": False,
                     "error": f"No trained embeddings found for class {class_id}. Please train the model first."
                 }
-            
-            print(f"Loaded {len(known_embeddings)} known embeddings for comparison")
-            
-            # Extract face encoding from input image
-            unknown_encoding = self.embeddings.extract_face_encoding(image_data)
+
+            logger.debug("Loaded %d known embeddings for comparison", len(gallery_ids))
+
+            # Extract face encoding in a worker thread — dlib's CNN would
+            # otherwise block the event loop for hundreds of milliseconds
+            async with self._encode_semaphore:
+                unknown_encoding = await asyncio.to_thread(
+                    self.embeddings.extract_face_encoding, image_data
+                )
             
             if unknown_encoding is None:
                 return {
@@ -139,13 +290,15 @@ class RecognitionService:
                     "error": "No face detected in the provided image"
                 }
             
-            print("Face detected and encoding extracted successfully")
+            logger.debug("Face detected and encoding extracted successfully")
             
-            # Find best match
-            match_result = self.embeddings.find_best_match(
-                known_embeddings, 
-                unknown_encoding, 
-                tolerance=self.recognition_threshold
+            # Find best match against the pre-stacked gallery
+            match_result = self.embeddings.match_gallery(
+                gallery_ids,
+                gallery_matrix,
+                unknown_encoding,
+                tolerance=self.recognition_threshold,
+                gallery_sq_norms=gallery_sq_norms
             )
             
             if match_result["matched"]:
@@ -156,7 +309,7 @@ class RecognitionService:
                 
                 student_name = student['name'] if student else "Unknown"
                 
-                print(f"Face recognized: {student_name} (confidence: {match_result['confidence']:.2f})")
+                logger.debug("Face recognized: %s (confidence: %.2f)", student_name, match_result["confidence"])
                 
                 return {
                     "matched": True,
@@ -165,7 +318,7 @@ class RecognitionService:
                     "confidence": match_result["confidence"]
                 }
             else:
-                print(f"No match found (best confidence: {match_result['confidence']:.2f})")
+                logger.debug("No match found (best confidence: %.2f)", match_result["confidence"])
                 return {
                     "matched": False,
                     "confidence": match_result["confidence"],
@@ -187,18 +340,21 @@ class RecognitionService:
         unknown faces.
         """
         try:
-            print(f"Starting batch face recognition for class {class_id}")
+            logger.debug("Starting batch face recognition for class %s", class_id)
 
-            known_embeddings = await self.load_class_embeddings(class_id)
-            if not known_embeddings:
+            gallery_ids, gallery_matrix, gallery_sq_norms = await self._get_gallery(class_id)
+            if not gallery_ids:
                 return {
                     "success": False,
                     "error": f"No trained embeddings found for class {class_id}. Please train the model first.",
                     "matches": []
                 }
 
-            # Extract ALL face encodings from the frame
-            face_data = self.embeddings.extract_all_face_encodings(image_data)
+            # Extract ALL face encodings from the frame in a worker thread
+            async with self._encode_semaphore:
+                face_data = await asyncio.to_thread(
+                    self.embeddings.extract_all_face_encodings, image_data
+                )
 
             if not face_data:
                 return {
@@ -208,7 +364,7 @@ class RecognitionService:
                     "message": "No faces detected in the image"
                 }
 
-            print(f"Found {len(face_data)} face(s) to match against {len(known_embeddings)} known students")
+            logger.debug("Found %d face(s) to match against %d known students", len(face_data), len(gallery_ids))
 
             # Pull student names once (avoid repeated Firestore calls)
             students = await self.firebase.get_class_students(class_id)
@@ -221,10 +377,12 @@ class RecognitionService:
                 encoding = face["encoding"]
                 location = face["location"]  # (top, right, bottom, left)
 
-                match_result = self.embeddings.find_best_match(
-                    known_embeddings,
+                match_result = self.embeddings.match_gallery(
+                    gallery_ids,
+                    gallery_matrix,
                     encoding,
-                    tolerance=self.recognition_threshold
+                    tolerance=self.recognition_threshold,
+                    gallery_sq_norms=gallery_sq_norms
                 )
 
                 top, right, bottom, left = location
@@ -235,7 +393,7 @@ class RecognitionService:
 
                     # Skip stale embeddings — student was removed from class after last training
                     if student_id not in student_name_map:
-                        print(f"Face {i}: stale embedding {student_id} not in current roster — treating as no match")
+                        logger.debug("Face %d: stale embedding %s not in current roster — treating as no match", i, student_id)
                         matches.append({
                             "faceIndex": i,
                             "matched": False,
@@ -247,7 +405,7 @@ class RecognitionService:
 
                     # Guard: don't match the same student twice in one frame
                     if student_id in matched_student_ids:
-                        print(f"Duplicate match for student {student_id} — skipping")
+                        logger.debug("Duplicate match for student %s — skipping", student_id)
                         matches.append({
                             "faceIndex": i,
                             "matched": False,
@@ -259,7 +417,7 @@ class RecognitionService:
 
                     matched_student_ids.add(student_id)
                     student_name = student_name_map[student_id]
-                    print(f"Face {i}: matched {student_name} (confidence {match_result['confidence']:.2f})")
+                    logger.debug("Face %d: matched %s (confidence %.2f)", i, student_name, match_result["confidence"])
 
                     matches.append({
                         "faceIndex": i,
@@ -270,7 +428,7 @@ class RecognitionService:
                         "faceBox": face_box
                     })
                 else:
-                    print(f"Face {i}: no match (best confidence {match_result['confidence']:.2f})")
+                    logger.debug("Face %d: no match (best confidence %.2f)", i, match_result["confidence"])
                     matches.append({
                         "faceIndex": i,
                         "matched": False,
@@ -1,131 +1,149 @@
 """
-Flask Liveness Detection Microservice
+FastAPI Liveness Detection Microservice
 Provides anti-spoofing liveness detection for face recognition.
 """
 
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from liveness_detector import LivenessDetector
+import asyncio
 import base64
 import traceback
 
-app = Flask(__name__)
-CORS(app, origins=["http://localhost:3000", "http://localhost:8000", "http://localhost:3001"])
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.middleware.cors import CORSMiddleware
+
+from liveness_detector import LivenessDetector
+
+app = FastAPI(title="Liveness Detection API", version="1.0.0")
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:3000", "http://localhost:8000", "http://localhost:3001"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 # Initialize liveness detector
 detector = LivenessDetector()
 
 
-@app.route('/health', methods=['GET'])
-def health_check():
+async def _get_image_data(request: Request):
+    """
+    Extract image bytes from the request. Accepts raw bytes
+    (application/octet-stream, preferred — no base64 overhead) or the
+    legacy JSON body with an image_base64 field.
+    Returns None when neither is present.
+    """
+    content_type = request.headers.get('content-type', '')
+    if content_type.startswith('application/octet-stream'):
+        image_data = await request.body()
+        return image_data if image_data else None
+
+    try:
+        data = await request.json()
+    except Exception:
+        return None
+    if not data or 'image_base64' not in data:
+        return None
+
+    image_base64 = data['image_base64']
+    if image_base64.startswith('data:image'):
+        image_base64 = image_base64.split(',', 1)[1]
+
+    return base64.b64decode(image_base64)
+
+
+@app.get("/health")
+async def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return {
         "status": "healthy",
         "service": "Liveness Detection API",
         "version": "1.0.0"
-    })
+    }
 
 
-@app.route('/liveness/check', methods=['POST'])
-def check_liveness():
+@app.post("/liveness/check")
+async def check_liveness(request: Request):
     """
     Main liveness check endpoint.
-    Accepts base64 encoded image and returns liveness analysis.
+    Accepts raw image bytes (or legacy base64 JSON) and returns liveness analysis.
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'image_base64' not in data:
-            return jsonify({
-                "error": "Missing image_base64 in request body"
-            }), 400
-        
-        # Decode base64 image
-        image_base64 = data['image_base64']
-        if image_base64.startswith('data:image'):
-            image_base64 = image_base64.split(',', 1)[1]
-        
-        image_data = base64.b64decode(image_base64)
-        
-        # Perform liveness check
-        result = detector.check_liveness(image_data)
-        
-        return jsonify(result)
-        
+        image_data = await _get_image_data(request)
+        if image_data is None:
+            return JSONResponse(status_code=400, content={
+                "error": "Missing image data (raw bytes or image_base64) in request body"
+            })
+
+        # OpenCV/dlib release the GIL — run the check in a worker thread so
+        # the event loop keeps accepting frames from other clients
+        result = await asyncio.to_thread(detector.check_liveness, image_data)
+
+        return result
+
     except Exception as e:
         traceback.print_exc()
-        return jsonify({
+        return JSONResponse(status_code=500, content={
             "error": str(e),
             "is_live": False,
             "confidence": 0.0
-        }), 500
+        })
 
 
-@app.route('/liveness/blink', methods=['POST'])
-def detect_blink():
+@app.post("/liveness/blink")
+async def detect_blink(request: Request):
     """
     Eye blink detection endpoint.
     Useful for multi-frame liveness verification.
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'image_base64' not in data:
-            return jsonify({
-                "error": "Missing image_base64 in request body"
-            }), 400
-        
-        image_base64 = data['image_base64']
-        if image_base64.startswith('data:image'):
-            image_base64 = image_base64.split(',', 1)[1]
-        
-        image_data = base64.b64decode(image_base64)
-        
-        result = detector.detect_blink(image_data)
-        
-        return jsonify(result)
-        
+        image_data = await _get_image_data(request)
+        if image_data is None:
+            return JSONResponse(status_code=400, content={
+                "error": "Missing image data (raw bytes or image_base64) in request body"
+            })
+
+        result = await asyncio.to_thread(detector.detect_blink, image_data)
+
+        return result
+
     except Exception as e:
         traceback.print_exc()
-        return jsonify({
+        return JSONResponse(status_code=500, content={
             "error": str(e),
             "blink_detected": False
-        }), 500
+        })
 
 
-@app.route('/liveness/analyze', methods=['POST'])
-def analyze_frame():
+@app.post("/liveness/analyze")
+async def analyze_frame(request: Request):
     """
     Detailed frame analysis for debugging.
     Returns all detection metrics.
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'image_base64' not in data:
-            return jsonify({
-                "error": "Missing image_base64 in request body"
-            }), 400
-        
-        image_base64 = data['image_base64']
-        if image_base64.startswith('data:image'):
-            image_base64 = image_base64.split(',', 1)[1]
-        
-        image_data = base64.b64decode(image_base64)
-        
-        result = detector.analyze_frame(image_data)
-        
-        return jsonify(result)
-        
+        image_data = await _get_image_data(request)
+        if image_data is None:
+            return JSONResponse(status_code=400, content={
+                "error": "Missing image data (raw bytes or image_base64) in request body"
+            })
+
+        result = await asyncio.to_thread(detector.analyze_frame, image_data)
+
+        return result
+
     except Exception as e:
         traceback.print_exc()
-        return jsonify({
+        return JSONResponse(status_code=500, content={
             "error": str(e)
-        }), 500
+        })
 
 
 if __name__ == '__main__':
     print("=" * 50)
     print("🛡️  Liveness Detection Service Starting...")
     print("=" * 50)
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    # For multi-process serving: uvicorn app:app --host 0.0.0.0 --port 5001 --workers $(nproc)
+    uvicorn.run(app, host='0.0.0.0', port=5001)